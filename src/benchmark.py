@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image, ImageChops
+
+import headless
+import model
+import renderer
+
+# Synthetic profiles, from what people actually write up to far more points
+# than fit on the screen at any zoom
+PROFILE_SIZES = { "small" : 12, "medium" : 1000, "large" : 100000 }
+ZOOM_LEVELS   = [ 5, 60 ]
+# Cursor as a share of the profile, None is idle with no cursor
+CURSORS       = { "idle" : None, "start" : 0.02, "middle" : 0.5 }
+
+GOLDEN_FOLDER = os.path.join( "resources", "golden" )
+TIMINGS_FILE  = "timings.json"
+# Renders well under a millisecond jitter by more than any sane tolerance
+TIMING_SLACK  = 0.5
+
+def writeProfiles( folder ) :
+  # Same profiles every time so frames can be compared against golden images
+  rng = np.random.RandomState( 0 )
+  for idx, ( size, count ) in enumerate( PROFILE_SIZES.items() ) :
+    time = np.linspace( 0, 600, count )
+    raw  = { "name" : size, "datasets" : [] }
+    for name, top, interp in [ ( "zaxis", 310, "cubic" ), ( "fan", 1, "linear" ), ( "lights", 1, "step" ) ] :
+      value = 0.5 * top * ( 1 + np.sin( time / ( 20 + 10 * len( raw[ "datasets" ] ) ) ) ) * rng.uniform( 0.8, 1.0, count )
+      raw[ "datasets" ].append( {
+                                 "name"   : name,
+                                 "time"   : time.round( 3 ).tolist(),
+                                 "value"  : value.round( 3 ).tolist(),
+                                 "interp" : interp,
+                                 "min"    : 0,
+                                 "max"    : top
+                                 } )
+    json.dump( raw, open( os.path.join( folder, "{0}_{1}.cfg".format( idx, size ) ), "w" ) )
+
+def cases() :
+  # ( name, profile index, zoom, cursor share )
+  for idx, size in enumerate( PROFILE_SIZES.keys() ) :
+    for zoom in ZOOM_LEVELS :
+      for cursor, share in CURSORS.items() :
+        yield "{0}-z{1}-{2}".format( size, zoom, cursor ), idx, zoom, share
+
+def setup( stationRenderer, dataModel, idx, zoom, share ) :
+  dataModel.currentConfigIdx_ = idx
+  dataModel.timeResolution_   = zoom
+  stationRenderer.mainWidgets_.widgets_[ "Resolution" ].text_ = "Interval " + str( zoom ) + " sec"
+  totalTime = dataModel.getCurrentTotalTime()
+  dataModel.currentTime_ = -1 if share is None else share * totalTime
+
+def timeRenders( stationRenderer, repeats, cold ) :
+  # Milliseconds per render, cold also throws away the cached background
+  samples = []
+  for i in range( repeats ) :
+    if cold :
+      for name, layer in stationRenderer.backgrounds_.items() :
+        layer.key_ = None
+    start = time.perf_counter()
+    stationRenderer.render()
+    samples.append( 1000 * ( time.perf_counter() - start ) )
+  return samples
+
+def compare( frame, filename ) :
+  # None if frame matches the golden image, else why not
+  if not os.path.exists( filename ) :
+    return "no golden image"
+  golden = Image.open( filename ).convert( frame.mode )
+  if golden.size != frame.size :
+    return "size " + str( frame.size ) + " != " + str( golden.size )
+  box = ImageChops.difference( golden, frame ).getbbox()
+  return None if box is None else "differs in " + str( box )
+
+def checkMonotone( trials=3000, seed=0 ) :
+  # Cubic datasets through random monotone breakpoints must stay monotone and
+  # inside the breakpoints, returns how many did not
+  rng = np.random.RandomState( seed )
+  failures = 0
+  for i in range( trials ) :
+    count = rng.randint( 2, 12 )
+    data  = model.DataSet( "zaxis" )
+    data.interp_ = model.Interpolation.CUBIC
+    data.time_   = np.cumsum( rng.uniform( 0.1, 5.0, count ) )
+    # Runs of equal values are where shared tangents used to go wrong
+    data.value_  = np.cumsum( rng.choice( [ 0.0, 1.0 ], count ) * rng.uniform( 0.0, 30.0, count ) ) * rng.choice( [ -1.0, 1.0 ] )
+    data.compile()
+
+    values = data.evaluate( np.linspace( data.time_[0], data.time_[-1], 2001 ) )
+    steps  = np.diff( values ) * ( 1.0 if data.value_[-1] >= data.value_[0] else -1.0 )
+    if values.max() > data.value_.max() + 1e-9 or values.min() < data.value_.min() - 1e-9 or steps.min() < -1e-9 :
+      failures += 1
+  return failures
+
+def run( repeats=20, update=False, tolerance=1.5, golden=GOLDEN_FOLDER ) :
+  # Returns how many cases failed
+  failures = checkMonotone()
+  print( "monotone cubic overshoots: " + str( failures ) )
+
+  timingsFile = os.path.join( golden, TIMINGS_FILE )
+  baseline = {}
+  if not update and os.path.exists( timingsFile ) :
+    baseline = json.load( open( timingsFile ) )
+
+  timings  = {}
+  with tempfile.TemporaryDirectory() as folder :
+    writeProfiles( folder )
+    dataModel = model.DataModel( )
+    dataModel.loadFolder( folder )
+    hwctrl = headless.HeadlessController( )
+    stationRenderer = renderer.Renderer( hwctrl, dataModel, os.path.join( folder, "history" ) )
+    stationRenderer.folderTimer_.stop()
+
+    print( "{0: <20} {1: >9} {2: >9} {3: >9}  {4}".format( "case", "warm ms", "cold ms", "baseline", "frame" ) )
+    for name, idx, zoom, share in cases() :
+      setup( stationRenderer, dataModel, idx, zoom, share )
+      # First render loads the profile and fills every cache
+      stationRenderer.render()
+      warm = float( np.median( timeRenders( stationRenderer, repeats, False ) ) )
+      cold = float( np.median( timeRenders( stationRenderer, repeats, True ) ) )
+      timings[ name ] = { "warm" : warm, "cold" : cold }
+
+      filename = os.path.join( golden, name + ".png" )
+      frame    = stationRenderer.frame_
+      if update :
+        os.makedirs( golden, exist_ok=True )
+        frame.save( filename )
+        problem = None
+      else :
+        problem = compare( frame, filename )
+      # What reached the panel through partial updates must be the frame too
+      if problem is None and ImageChops.difference( hwctrl.device_.shown(), frame ).getbbox() is not None :
+        problem = "panel does not match frame"
+
+      slower = name in baseline and warm > max( tolerance * baseline[ name ][ "warm" ], baseline[ name ][ "warm" ] + TIMING_SLACK )
+      if slower and problem is None :
+        problem = "slower than baseline"
+      if problem is not None :
+        failures += 1
+
+      print( "{0: <20} {1: >9.3f} {2: >9.3f} {3: >9} {4}".format(
+                                                                  name, warm, cold,
+                                                                  "{0:.3f}".format( baseline[ name ][ "warm" ] ) if name in baseline else "-",
+                                                                  " ok" if problem is None else " FAIL " + problem
+                                                                  ) )
+
+  if update :
+    json.dump( timings, open( timingsFile, "w" ), indent=2, sort_keys=True )
+    print( "Golden frames and timings written to " + golden )
+  return failures
+
+
+if __name__ == '__main__':
+  # Run from the top of the repository, like main.py
+  parser = argparse.ArgumentParser( description="Time renders over profile sizes, zoom levels and cursor positions and check frames against golden images" )
+  parser.add_argument( "--update",    action="store_true", help="write new golden frames and baseline timings" )
+  parser.add_argument( "--repeats",   type=int,   default=20,  help="renders timed per case" )
+  parser.add_argument( "--tolerance", type=float, default=1.5, help="fail when warm renders are this many times slower than baseline" )
+  parser.add_argument( "--golden",    default=GOLDEN_FOLDER,   help="folder of golden frames and timings" )
+  args = parser.parse_args()
+
+  failures = run( args.repeats, args.update, args.tolerance, args.golden )
+  if failures > 0 :
+    print( str( failures ) + " cases failed" )
+  sys.exit( 1 if failures > 0 else 0 )
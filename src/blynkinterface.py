@@ -76,6 +76,7 @@ class BlynkInterface( object ) :
     self.pins_[ "auto_runner"    ] = { "vnum" : 18, "value" : 0, "ignoreZero" : False, "int" : True }
     self.pins_[ "mode_switcher"  ] = { "vnum" : 52, "value" : 0, "ignoreZero" : False, "int" : True }
     self.pins_[ "active_data"    ] = { "vnum" : 19, "value" : 0, "ignoreZero" : False, "int" : True }
+    self.pins_[ "uv_dose"        ] = { "vnum" : 53, "value" : 0, "ignoreZero" : False, "int" : False }
     
     self.pins_[ "edit_profile"          ] = { "vnum" : 20, "value" : 0, "ignoreZero" : False, "int" : True }
     self.pins_[ "edit_resolution"       ] = { "vnum" : 21, "value" : 0, "ignoreZero" : False, "int" : True }
@@ -116,6 +117,8 @@ class BlynkInterface( object ) :
     self.pins_[ "settings_manual_full_notify_disabled" ] = { "vnum" : 48, "value" : 0, "ignoreZero" : False, "int" : True }
     self.pins_[ "settings_auto_half_notify_disabled" ] = { "vnum" : 49, "value" : 0, "ignoreZero" : False, "int" : True }
     self.pins_[ "settings_auto_full_notify_disabled" ] = { "vnum" : 50, "value" : 0, "ignoreZero" : False, "int" : True }
+    # Dump render stage timings to the settings terminal
+    self.pins_[ "settings_render_timings" ] = { "vnum" : 54, "value" : 0, "ignoreZero" : True, "int" : True }
     
     self.virtualPinMap_ = {}
     for key, value in self.pins_.items() :
@@ -151,9 +154,29 @@ class BlynkInterface( object ) :
     sys.stdout = oldstdout
     self._print( output )
 
+  def snapshot( self ) :
+    # Model state as of one moment, read under the renderer's lock since
+    # looking data up moves the same dataset cursors a frame does
+    self.renderer_.lock_.acquire()
+    try :
+      currentData = self.renderer_.model_.getCurrentData( )
+      return {
+              "data"      : dict( currentData ) if currentData is not None else {},
+              "mode"      : self.renderer_.model_.controlMode_,
+              "time"      : self.renderer_.model_.currentTime_,
+              "totalTime" : self.renderer_.model_.currentTotalTime_,
+              "dose"      : self.renderer_.model_.getDose(),
+              "configIdx" : self.renderer_.model_.currentConfigIdx_,
+              "config"    : self.renderer_.model_.getCurrentConfig(),
+              "profiles"  : self.renderer_.model_.getProfileNames()
+              }
+    finally :
+      self.renderer_.lock_.release()
+
   def syncAll( self ) :
     self.lock_.acquire()
     print( "Locking resources to synchronize data..." )
+    state = self.snapshot()
     
     for key, value in self.pins_.items() :
       if key == "main_terminal" :
@@ -169,21 +192,21 @@ class BlynkInterface( object ) :
       elif key == "cpu_temperature" :
         self.pins_[ "cpu_temperature" ]["value"] = gz.CPUTemperature().temperature
       elif key == "zaxis" :
-        self.pins_[ "zaxis"            ]["value"] = self.renderer_.model_.getCurrentData( "zaxis" )
+        self.pins_[ "zaxis"            ]["value"] = state[ "data" ].get( "zaxis", 0 )
       elif key == "manual_zaxis_inc" :
         #self.pins_[ "manual_zaxis_inc" ]["value"] = 0
         self.blynk_.set_property( self.pins_[ "manual_zaxis_inc" ][ "vnum" ], "labels", *[e.name for e in hardware.StepSize] )
       # elif key == "manual_zaxis_rst" :
       #   self.pins_[ "manual_zaxis_rst" ]["value"] = 0
       elif key == "fan" :
-        self.pins_[ "fan"            ]["value"] = self.renderer_.model_.getCurrentData( "fan" )
+        self.pins_[ "fan"            ]["value"] = state[ "data" ].get( "fan", 0 )
         self.blynk_.set_property( self.pins_[ "fan" ][ "vnum" ], "step", self.pins_[ "manual_fan_inc" ]["value"] )
       # elif key == "manual_fan_inc" :
       #   self.pins_[ "manual_fan_inc" ]["value"] = 
       # elif key == "manual_fan_rst" :
       #   self.pins_[ "manual_fan_rst" ]["value"] = 
       elif key == "uvled" :
-        self.pins_[ "uvled"            ]["value"] = self.renderer_.model_.getCurrentData( "lights" )
+        self.pins_[ "uvled"            ]["value"] = state[ "data" ].get( "lights", 0 )
         self.blynk_.set_property( self.pins_[ "uvled" ][ "vnum" ], "step", self.pins_[ "manual_uvled_inc" ]["value"] )
       # elif key == "manual_uvled_inc" :
       #   self.pins_[ "manual_uvled_inc" ]["value"] = 
@@ -200,24 +223,26 @@ class BlynkInterface( object ) :
       # elif key == "manual_mode" :
       #   self.pins_[ "manual_mode"      ]["value"] = 0
       elif key == "manual_time_rem" :
-        if self.renderer_.model_.controlMode_ == model.ControlModes.MANUAL :
-          self.pins_[ "manual_time_rem" ]["value"] = str( timedelta( seconds=int( self.renderer_.model_.currentTotalTime_ - max( self.renderer_.model_.currentTime_, 0 ) ) ) )
+        if state[ "mode" ] == model.ControlModes.MANUAL :
+          self.pins_[ "manual_time_rem" ]["value"] = str( timedelta( seconds=int( state[ "totalTime" ] - max( state[ "time" ], 0 ) ) ) )
       # elif key == "manual_time_sec" :
       #   self.pins_[ "manual_time_sec" ]["value"] = 0
       # elif key == "manual_time_min" :
       #   self.pins_[ "manual_time_min" ]["value"] = 0
       elif key == "active_profile" :
-        self.pins_[ "active_profile" ]["value"] = self.renderer_.model_.currentConfigIdx_ + 1
-        self.blynk_.set_property( self.pins_[ "active_profile" ][ "vnum" ], "labels", *self.renderer_.model_.getProfileNames() )
+        self.pins_[ "active_profile" ]["value"] = state[ "configIdx" ] + 1
+        self.blynk_.set_property( self.pins_[ "active_profile" ][ "vnum" ], "labels", *state[ "profiles" ] )
       # elif key == "auto_mode" :
       #   self.pins_[ "auto_mode"      ]["value"] = 0
       elif key == "auto_runner" :
         self.pins_[ "auto_runner"    ]["value"] = 0
       elif key == "active_data" :
         self.pins_[ "active_data"    ]["value"] = 0
+      elif key == "uv_dose" :
+        self.pins_[ "uv_dose"        ]["value"] = self.formatDose( state[ "dose" ] )
       elif key == "edit_profile" :
         #self.pins_[ "edit_profile"          ]["value"] = 0
-        self.blynk_.set_property( self.pins_[ "edit_profile" ][ "vnum" ], "labels", *self.renderer_.model_.getProfileNames() )
+        self.blynk_.set_property( self.pins_[ "edit_profile" ][ "vnum" ], "labels", *state[ "profiles" ] )
       elif key == "edit_resolution" :
         #self.pins_[ "edit_resolution"       ]["value"] = 0
         self.blynk_.set_property( self.pins_[ "edit_resolution" ][ "vnum" ], "labels", "5 sec", "10 sec", "20 sec", "30 sec", "45 sec", "60 sec" )
@@ -256,9 +281,9 @@ class BlynkInterface( object ) :
       elif key == "edit_uvled_disabled" :
         self.pins_[ "edit_uvled_disabled"   ]["value"] = 0
       elif key == "edit_profile_name" :
-        self.pins_[ "edit_profile_name" ]["value"] = self.renderer_.model_.getCurrentConfig().name_
+        self.pins_[ "edit_profile_name" ]["value"] = state[ "config" ].name_
       elif key == "edit_filename" :
-        self.pins_[ "edit_filename"     ]["value"] = self.renderer_.model_.getCurrentConfig().filename_
+        self.pins_[ "edit_filename"     ]["value"] = state[ "config" ].filename_
       elif key == "edit_duplicate" :
         self.pins_[ "edit_duplicate"      ]["value"] = 0
       elif key == "edit_new_profile" :
@@ -295,12 +320,21 @@ class BlynkInterface( object ) :
     ##
     ## ZAXIS
     if self.virtualPinMap_[pin]["name"] == "zaxis" :
-      if self.renderer_.model_.controlMode_ != model.ControlModes.AUTO_RUN :
-        self.renderer_.model_.currentData_[ "zaxis" ] = max( min( self.renderer_.model_.currentData_[ "zaxis" ] + self.pins_[ "zaxis" ][ "value" ], 310.0 ), 0.0 ) 
-      else :
+      # Handlers change what the render thread is drawing from, the app is
+      # only told after letting go of it
+      self.renderer_.lock_.acquire()
+      try :
+        manual = self.renderer_.model_.controlMode_ != model.ControlModes.AUTO_RUN
+        if manual :
+          self.renderer_.model_.currentData_[ "zaxis" ] = max( min( self.renderer_.model_.currentData_[ "zaxis" ] + self.pins_[ "zaxis" ][ "value" ], 310.0 ), 0.0 )
+        current = self.renderer_.model_.currentData_[ "zaxis" ]
+      finally :
+        self.renderer_.lock_.release()
+
+      if not manual :
         # Shoot back to user and revert
         print( "ERROR: Not in manual mode. Please switch to manual mode to change values..." )
-        self.blynk_.virtual_write( pin, self.renderer_.model_.currentData_[ "zaxis" ] )
+        self.blynk_.virtual_write( pin, current )
 
     elif self.virtualPinMap_[pin]["name"] == "manual_zaxis_inc" :
       print( "Setting z axis step to : " + str( hardware.StepSize( self.pins_[ "manual_zaxis_inc" ]["value"] ).value ) )
@@ -312,13 +346,19 @@ class BlynkInterface( object ) :
     ##
     ## FAN  
     elif self.virtualPinMap_[pin]["name"] == "fan" :
-      if self.renderer_.model_.controlMode_ != model.ControlModes.AUTO_RUN :
-        self.renderer_.model_.currentData_[ "fan" ] = max( min( self.renderer_.model_.currentData_[ "fan" ] + self.pins_[ "fan" ]["value"], 1.0 ), 0.0 )
-      else :
-        
+      self.renderer_.lock_.acquire()
+      try :
+        manual = self.renderer_.model_.controlMode_ != model.ControlModes.AUTO_RUN
+        if manual :
+          self.renderer_.model_.currentData_[ "fan" ] = max( min( self.renderer_.model_.currentData_[ "fan" ] + self.pins_[ "fan" ][ "value" ], 1.0 ), 0.0 )
+        current = self.renderer_.model_.currentData_[ "fan" ]
+      finally :
+        self.renderer_.lock_.release()
+
+      if not manual :
         # Shoot back to user and revert
         print( "ERROR: Not in manual mode. Please switch to manual mode to change values..." )
-        self.blynk_.virtual_write( pin, self.renderer_.model_.currentData_[ "fan" ] )
+        self.blynk_.virtual_write( pin, current )
          
     elif self.virtualPinMap_[pin]["name"] == "manual_fan_inc" :
       self.blynk_.set_property( self.pins_[ "fan" ][ "vnum" ], "step", self.pins_[ "manual_fan_inc" ]["value"] )
@@ -330,12 +370,19 @@ class BlynkInterface( object ) :
     ##
     ## UVLED
     elif self.virtualPinMap_[pin]["name"] == "uvled" :
-      if self.renderer_.model_.controlMode_ != model.ControlModes.AUTO_RUN :
-        self.renderer_.model_.currentData_[ "lights" ] = max( min( self.renderer_.model_.currentData_[ "lights" ] + self.pins_[ "uvled" ]["value"], 1.0 ), 0.0 )
-      else :
+      self.renderer_.lock_.acquire()
+      try :
+        manual = self.renderer_.model_.controlMode_ != model.ControlModes.AUTO_RUN
+        if manual :
+          self.renderer_.model_.currentData_[ "lights" ] = max( min( self.renderer_.model_.currentData_[ "lights" ] + self.pins_[ "uvled" ][ "value" ], 1.0 ), 0.0 )
+        current = self.renderer_.model_.currentData_[ "lights" ]
+      finally :
+        self.renderer_.lock_.release()
+
+      if not manual :
         # Shoot back to user and revert
         print( "ERROR: Not in manual mode. Please switch to manual mode to change values..." )
-        self.blynk_.virtual_write( pin, self.renderer_.model_.currentData_[ "lights" ] )  
+        self.blynk_.virtual_write( pin, current )  
       
     elif self.virtualPinMap_[pin]["name"] == "manual_uvled_inc" :
       self.blynk_.set_property( self.pins_[ "uvled" ][ "vnum" ], "step", self.pins_[ "manual_uvled_inc" ]["value"] )
@@ -350,17 +397,22 @@ class BlynkInterface( object ) :
     ##
     ## Start, Stop + Pause
     elif self.virtualPinMap_[pin]["name"] == "manual_start_timer" :
-      if not self.renderer_.runningTimer_ and self.renderer_.model_.controlMode_ == model.ControlModes.MANUAL :
-        # We are about to turn it on
-        self.renderer_.model_.currentTotalTime_ = self.pins_[ "manual_time_sec" ][ "value" ] + self.pins_[ "manual_time_min" ][ "value" ] * 60
-      
-      self.renderer_.handleStartPauseTimer( )
+      self.renderer_.lock_.acquire()
+      try :
+        if not self.renderer_.runningTimer_ and self.renderer_.model_.controlMode_ == model.ControlModes.MANUAL :
+          # We are about to turn it on
+          self.renderer_.model_.currentTotalTime_ = self.pins_[ "manual_time_sec" ][ "value" ] + self.pins_[ "manual_time_min" ][ "value" ] * 60
+        self.renderer_.handleStartPauseTimer( )
+      finally :
+        self.renderer_.lock_.release()
+
       self.pins_[ "auto_runner" ][ "value" ] = int( not( self.pins_["manual_start_timer"]["value"] ) ) + 1 
       self.blynk_.virtual_write( self.pins_["auto_runner"][ "vnum" ], self.pins_["auto_runner"]["value"] )
       
                     
     elif self.virtualPinMap_[pin]["name"] == "manual_stop_timer" :
       self.renderer_.handleStopTimer( )
+      refreshRender = True
       self.pins_["manual_start_timer"]["value"] = 0
       self.blynk_.virtual_write( self.pins_["manual_start_timer"][ "vnum" ], self.pins_["manual_start_timer"]["value"] )
 
@@ -376,24 +428,44 @@ class BlynkInterface( object ) :
     ##
     ## Manual Time Settings
     elif self.virtualPinMap_[pin]["name"] == "manual_time_sec" :
-      if self.renderer_.model_.controlMode_ == model.ControlModes.MANUAL :
-        self.renderer_.model_.currentTotalTime_ = self.pins_[ "manual_time_sec" ][ "value" ] + self.pins_[ "manual_time_min" ][ "value" ] * 60
-        self.pins_[ "manual_time_rem" ]["value"] = str( timedelta( seconds=int( self.renderer_.model_.currentTotalTime_ - max( self.renderer_.model_.currentTime_, 0 ) ) ) )
+      self.renderer_.lock_.acquire()
+      try :
+        manual = self.renderer_.model_.controlMode_ == model.ControlModes.MANUAL
+        if manual :
+          self.renderer_.model_.currentTotalTime_ = self.pins_[ "manual_time_sec" ][ "value" ] + self.pins_[ "manual_time_min" ][ "value" ] * 60
+          remaining = self.renderer_.model_.currentTotalTime_ - max( self.renderer_.model_.currentTime_, 0 )
+      finally :
+        self.renderer_.lock_.release()
+
+      if manual :
+        self.pins_[ "manual_time_rem" ]["value"] = str( timedelta( seconds=int( remaining ) ) )
         self.blynk_.virtual_write( self.pins_["manual_time_rem"][ "vnum" ], self.pins_["manual_time_rem"]["value"] )
       else :
         print( "WARNING: Time remaining will not be previewed while not in manual mode." )
              
     elif self.virtualPinMap_[pin]["name"] == "manual_time_min" :
-      if self.renderer_.model_.controlMode_ == model.ControlModes.MANUAL :
-        self.renderer_.model_.currentTotalTime_ = self.pins_[ "manual_time_sec" ][ "value" ] + self.pins_[ "manual_time_min" ][ "value" ] * 60
-        self.pins_[ "manual_time_rem" ]["value"] = str( timedelta( seconds=int( self.renderer_.model_.currentTotalTime_ - max( self.renderer_.model_.currentTime_, 0 ) ) ) )
+      self.renderer_.lock_.acquire()
+      try :
+        manual = self.renderer_.model_.controlMode_ == model.ControlModes.MANUAL
+        if manual :
+          self.renderer_.model_.currentTotalTime_ = self.pins_[ "manual_time_sec" ][ "value" ] + self.pins_[ "manual_time_min" ][ "value" ] * 60
+          remaining = self.renderer_.model_.currentTotalTime_ - max( self.renderer_.model_.currentTime_, 0 )
+      finally :
+        self.renderer_.lock_.release()
+
+      if manual :
+        self.pins_[ "manual_time_rem" ]["value"] = str( timedelta( seconds=int( remaining ) ) )
         self.blynk_.virtual_write( self.pins_["manual_time_rem"][ "vnum" ], self.pins_["manual_time_rem"]["value"] )
       else :
         print( "WARNING: Time remaining will not be previewed while not in manual mode." )
 
         
     elif self.virtualPinMap_[pin]["name"] == "active_profile" :
-      self.renderer_.model_.currentConfigIdx_ = int( self.pins_[ "active_profile" ]["value"] ) - 1
+      self.renderer_.lock_.acquire()
+      try :
+        self.renderer_.model_.currentConfigIdx_ = int( self.pins_[ "active_profile" ]["value"] ) - 1
+      finally :
+        self.renderer_.lock_.release()
       refreshRender = True
 
     ###################################################################
@@ -411,25 +483,38 @@ class BlynkInterface( object ) :
       # 1 is run   => start timer
       # 2 is pause => pause timer
       # 3 is stop  => stop  timer
-      if self.pins_[ "auto_runner" ][ "value" ] == 1 and not self.renderer_.runningTimer_ :
-        if not self.renderer_.runningTimer_ and self.renderer_.model_.controlMode_ == model.ControlModes.MANUAL :
-          # We are about to turn it on
-          self.renderer_.model_.currentTotalTime_ = self.pins_[ "manual_time_sec" ][ "value" ] + self.pins_[ "manual_time_min" ][ "value" ] * 60
-        self.renderer_.handleStartPauseTimer( )
-        self.pins_["manual_start_timer"]["value"] = 1
-        self.blynk_.virtual_write( self.pins_["manual_start_timer"][ "vnum" ], self.pins_["manual_start_timer"]["value"] )
-      elif self.pins_[ "auto_runner" ][ "value" ] == 2 and self.renderer_.runningTimer_ :
-        self.renderer_.handleStartPauseTimer( )
-        self.pins_["manual_start_timer"]["value"] = 0
+      started = None
+      self.renderer_.lock_.acquire()
+      try :
+        if self.pins_[ "auto_runner" ][ "value" ] == 1 and not self.renderer_.runningTimer_ :
+          if self.renderer_.model_.controlMode_ == model.ControlModes.MANUAL :
+            # We are about to turn it on
+            self.renderer_.model_.currentTotalTime_ = self.pins_[ "manual_time_sec" ][ "value" ] + self.pins_[ "manual_time_min" ][ "value" ] * 60
+          self.renderer_.handleStartPauseTimer( )
+          started = 1
+        elif self.pins_[ "auto_runner" ][ "value" ] == 2 and self.renderer_.runningTimer_ :
+          self.renderer_.handleStartPauseTimer( )
+          started = 0
+        elif self.pins_[ "auto_runner" ][ "value" ] == 3 :
+          self.renderer_.handleStopTimer( )
+          refreshRender = True
+      finally :
+        self.renderer_.lock_.release()
+
+      if started is not None :
+        self.pins_["manual_start_timer"]["value"] = started
         self.blynk_.virtual_write( self.pins_["manual_start_timer"][ "vnum" ], self.pins_["manual_start_timer"]["value"] )
-      elif self.pins_[ "auto_runner" ][ "value" ] == 3 :
-        self.renderer_.handleStopTimer( )        
 
     elif self.virtualPinMap_[pin]["name"] == "mode_switcher" :
-      self.renderer_.model_.controlMode_ = model.ControlModes( self.pins_[ "mode_switcher" ][ "value" ] )
-
-      self.pins_[ "manual_mode" ][ "value" ] = (     self.renderer_.model_.controlMode_.value ) * 255
-      self.pins_[ "auto_mode"   ][ "value" ] = ( not self.renderer_.model_.controlMode_.value ) * 255
+      controlMode = model.ControlModes( self.pins_[ "mode_switcher" ][ "value" ] )
+      self.renderer_.lock_.acquire()
+      try :
+        self.renderer_.model_.controlMode_ = controlMode
+      finally :
+        self.renderer_.lock_.release()
+
+      self.pins_[ "manual_mode" ][ "value" ] = (     controlMode.value ) * 255
+      self.pins_[ "auto_mode"   ][ "value" ] = ( not controlMode.value ) * 255
       self.blynk_.virtual_write( self.pins_["manual_mode"][ "vnum" ], self.pins_["manual_mode"]["value"] )
       self.blynk_.virtual_write( self.pins_["auto_mode"  ][ "vnum" ], self.pins_["auto_mode"  ]["value"] )
       
@@ -437,7 +522,7 @@ class BlynkInterface( object ) :
       self.pins_[ "active_data"    ]
 
     if refreshRender :
-      self.renderer_.render()
+      self.renderer_.requestRender()
     
   def edit_handler( self, pin ) :
     print( "In edit handler via pin " + str( pin ) + " called " + self.virtualPinMap_[ pin ][ "name" ] )
@@ -505,12 +590,24 @@ class BlynkInterface( object ) :
     elif self.virtualPinMap_[pin]["name"] == "cpu_temperature" :
       self.pins_[ "cpu_temperature" ]
     elif self.virtualPinMap_[pin]["name"] == "settings_global_zaxis_disabled" :
-      self.renderer_.model_.zaxisEnabled_ = not bool( self.pins_[ "settings_global_zaxis_disabled" ]["value"] )
+      self.renderer_.lock_.acquire()
+      try :
+        self.renderer_.model_.zaxisEnabled_ = not bool( self.pins_[ "settings_global_zaxis_disabled" ]["value"] )
+      finally :
+        self.renderer_.lock_.release()
       print( "Set self.renderer_.model_.zaxisEnabled_ to " + str( self.renderer_.model_.zaxisEnabled_ ) )
     elif self.virtualPinMap_[pin]["name"] == "settings_global_fan_disabled" :
-      self.renderer_.model_.fanEnabled_   = not bool( self.pins_[ "settings_global_fan_disabled"   ]["value"] )
+      self.renderer_.lock_.acquire()
+      try :
+        self.renderer_.model_.fanEnabled_   = not bool( self.pins_[ "settings_global_fan_disabled"   ]["value"] )
+      finally :
+        self.renderer_.lock_.release()
     elif self.virtualPinMap_[pin]["name"] == "settings_global_uvled_disabled" :
-      self.renderer_.model_.uvledEnabled_ = not bool( self.pins_[ "settings_global_uvled_disabled" ]["value"] )
+      self.renderer_.lock_.acquire()
+      try :
+        self.renderer_.model_.uvledEnabled_ = not bool( self.pins_[ "settings_global_uvled_disabled" ]["value"] )
+      finally :
+        self.renderer_.lock_.release()
     #elif self.virtualPinMap_[pin]["name"] == "settings_manual_half_notify_disabled" :
     #  self.pins_[ "settings_manual_half_notify_disabled" ]
     #elif self.virtualPinMap_[pin]["name"] == "settings_manual_full_notify_disabled" :
@@ -519,15 +616,24 @@ class BlynkInterface( object ) :
       self.pins_[ "settings_auto_half_notify_disabled" ]
     elif self.virtualPinMap_[pin]["name"] == "settings_auto_full_notify_disabled" :
       self.pins_[ "settings_auto_full_notify_disabled" ]
+    elif self.virtualPinMap_[pin]["name"] == "settings_render_timings" :
+      self.renderer_.lock_.acquire()
+      try :
+        report = self.renderer_.metrics_.report( self.renderer_.frameStats() )
+      finally :
+        self.renderer_.lock_.release()
+      for line in report :
+        self.blynk_.virtual_write( self.pins_[ "settings_terminal" ][ "vnum" ], line + "\n" )
 
   def periodicUpdates( self ) :
         
     if self.renderer_ is not None :
       if self.renderer_.runningTimer_ :
         self.lock_.acquire()
+        state = self.snapshot()
         
         # What is running
-        if self.renderer_.model_.controlMode_ == model.ControlModes.AUTO_RUN :
+        if state[ "mode" ] == model.ControlModes.AUTO_RUN :
           self.pins_[ "auto_mode" ][ "value" ] = ( self.pins_[ "auto_mode" ][ "value" ] + 15 ) % 260
           self.blynk_.virtual_write( self.pins_[ "auto_mode" ][ "vnum" ], self.pins_[ "auto_mode" ][ "value" ] )
 
@@ -535,7 +641,7 @@ class BlynkInterface( object ) :
             self.pins_[ "manual_mode" ][ "value" ] = 0
             self.blynk_.virtual_write( self.pins_[ "manual_mode" ][ "vnum" ], self.pins_[ "manual_mode" ][ "value" ] )
             
-        elif self.renderer_.model_.controlMode_ == model.ControlModes.MANUAL :
+        elif state[ "mode" ] == model.ControlModes.MANUAL :
           self.pins_[ "manual_mode" ][ "value" ] = ( self.pins_[ "manual_mode" ][ "value" ] + 15 ) % 260
           self.blynk_.virtual_write( self.pins_[ "manual_mode" ][ "vnum" ], self.pins_[ "manual_mode" ][ "value" ] )
 
@@ -543,13 +649,12 @@ class BlynkInterface( object ) :
             self.pins_[ "auto_mode" ][ "value" ] = 0
             self.blynk_.virtual_write( self.pins_[ "auto_mode" ][ "vnum" ], self.pins_[ "auto_mode" ][ "value" ] )
 
-          self.pins_[ "manual_time_rem" ]["value"] = str( timedelta( seconds=int( self.renderer_.model_.currentTotalTime_ - max( self.renderer_.model_.currentTime_, 0 ) ) ) )
+          self.pins_[ "manual_time_rem" ]["value"] = str( timedelta( seconds=int( state[ "totalTime" ] - max( state[ "time" ], 0 ) ) ) )
           self.blynk_.virtual_write( self.pins_[ "manual_time_rem" ][ "vnum" ], self.pins_[ "manual_time_rem" ]["value"] )
             
         
-        currentData = self.renderer_.model_.getCurrentData( )
         dataId      = 0
-        for name, value in currentData.items() :
+        for name, value in state[ "data" ].items() :
           self.blynk_.virtual_write( self.pins_[ "active_data" ][ "vnum" ], "add", dataId, name, "{:.2f}".format( value ) )
           dataId += 1
           if name == "zaxis" :
@@ -559,24 +664,27 @@ class BlynkInterface( object ) :
           elif name == "lights" :
             self.blynk_.virtual_write( self.pins_[ "uvled" ][ "vnum" ], value )
             
-        self.blynk_.virtual_write( self.pins_[ "active_data" ][ "vnum" ], "add", dataId, "time", "{:.2f}".format( self.renderer_.model_.currentTime_ ) )
+        self.blynk_.virtual_write( self.pins_[ "active_data" ][ "vnum" ], "add", dataId, "time", "{:.2f}".format( state[ "time" ] ) )
+
+        self.pins_[ "uv_dose" ][ "value" ] = self.formatDose( state[ "dose" ] )
+        self.blynk_.virtual_write( self.pins_[ "uv_dose" ][ "vnum" ], self.pins_[ "uv_dose" ][ "value" ] )
 
         if ( not self.halfNotified_ and
              (
-               ( self.renderer_.model_.controlMode_ == model.ControlModes.MANUAL   and not bool(self.pins_[ "settings_manual_half_notify_disabled" ]["value"]) ) or
-               ( self.renderer_.model_.controlMode_ == model.ControlModes.AUTO_RUN and not bool(self.pins_[ "settings_auto_half_notify_disabled" ]  ["value"]) ) )
+               ( state[ "mode" ] == model.ControlModes.MANUAL   and not bool(self.pins_[ "settings_manual_half_notify_disabled" ]["value"]) ) or
+               ( state[ "mode" ] == model.ControlModes.AUTO_RUN and not bool(self.pins_[ "settings_auto_half_notify_disabled" ]  ["value"]) ) )
              ) :
-          if self.renderer_.model_.currentTime_ >= self.renderer_.model_.currentTotalTime_ / 2 :
-            self.blynk_.notify( "Cycle half-way done, time left : " + str( timedelta( seconds=int( self.renderer_.model_.currentTotalTime_ - self.renderer_.model_.currentTime_ ) ) ) + "s" )
+          if state[ "time" ] >= state[ "totalTime" ] / 2 :
+            self.blynk_.notify( "Cycle half-way done, time left : " + str( timedelta( seconds=int( state[ "totalTime" ] - state[ "time" ] ) ) ) + "s" )
             self.halfNotified_ = True
 
         if ( not self.fullNotified_ and
-             ( ( self.renderer_.model_.controlMode_ == model.ControlModes.MANUAL   and not bool(self.pins_[ "settings_manual_full_notify_disabled" ]["value"]) ) or
-               ( self.renderer_.model_.controlMode_ == model.ControlModes.AUTO_RUN and not bool(self.pins_[ "settings_auto_full_notify_disabled" ]  ["value"]) ) )
+             ( ( state[ "mode" ] == model.ControlModes.MANUAL   and not bool(self.pins_[ "settings_manual_full_notify_disabled" ]["value"]) ) or
+               ( state[ "mode" ] == model.ControlModes.AUTO_RUN and not bool(self.pins_[ "settings_auto_full_notify_disabled" ]  ["value"]) ) )
              ) :
           # We are within 1 second of done
-          if ( self.renderer_.model_.currentTotalTime_ - self.renderer_.model_.currentTime_ ) < 1.0 :
-            self.blynk_.notify( "Cycle done, time elapsed : " + str( timedelta( seconds=int( self.renderer_.model_.currentTotalTime_ ) ) ) + "s" )
+          if ( state[ "totalTime" ] - state[ "time" ] ) < 1.0 :
+            self.blynk_.notify( "Cycle done, time elapsed : " + str( timedelta( seconds=int( state[ "totalTime" ] ) ) ) + "s" )
             self.fullNotified_ = True
             # Turn off anything that was running it before
             self.pins_["manual_start_timer"]["value"] = 0
@@ -597,6 +705,13 @@ class BlynkInterface( object ) :
           self.syncAll()
             
     
+  def formatDose( self, dose ) :
+    # "delivered / remaining" UV dose from getDose(), remaining only known for a profile
+    delivered, total, remaining = dose
+    if remaining is None :
+      return "{:.2f}".format( delivered )
+    return "{:.2f} / {:.2f}".format( delivered, remaining )
+
   def communicate( self ) :
     while self.com_ :
       self.blynk_.run()
@@ -0,0 +1,69 @@
+import threading
+from time import perf_counter
+
+import luma.core.sprite_system as luma_sprite
+
+# Frames per second the display is redrawn at for what the station is doing,
+# a rate of 0 or less only redraws when a frame is requested
+DEFAULT_RATES = {
+                 # Buttons pressed in the last holdTime seconds
+                 "interactive" : 30.0,
+                 # A profile is running, its values change slowly
+                 "running"     : 4.0,
+                 # Nothing to show but folder changes and remote edits
+                 "idle"        : 1.0,
+                 "holdTime"    : 2.0
+                 }
+
+class FrameGovernor( luma_sprite.framerate_regulator ) :
+  """Regulates the frame rate like luma's framerate_regulator, but picks the rate from activity and
+  cuts a slow frame short the moment someone interacts"""
+  def __init__( self, rates=None, running=None ) :
+    self.rates_ = dict( DEFAULT_RATES )
+    self.rates_.update( rates or {} )
+    super(FrameGovernor, self).__init__( fps=self.rates_[ "interactive" ] )
+
+    # Callable telling us if a profile is running
+    self.running_         = running or ( lambda : False )
+    self.lastInteraction_ = None
+    self.requested_       = False
+    self.wake_            = threading.Event()
+
+  def interact( self ) :
+    self.lastInteraction_ = perf_counter()
+    self.wake_.set()
+
+  def request( self ) :
+    # A frame was asked for, which is all that ends a wait at a rate of 0
+    self.requested_ = True
+    self.wake_.set()
+
+  def mode( self ) :
+    if self.lastInteraction_ is not None and perf_counter() - self.lastInteraction_ < self.rates_[ "holdTime" ] :
+      return "interactive"
+    return "running" if self.running_() else "idle"
+
+  def rate( self ) :
+    return self.rates_[ self.mode() ]
+
+  def __exit__( self, *args ) :
+    self.called += 1
+    self.total_transit_time += perf_counter() - self.enter_time
+
+    # Wait out the frame time of whatever mode we are in, starting over
+    # whenever an interaction may have sped us up
+    while True :
+      self.wake_.clear()
+      rate = self.rate()
+      if rate <= 0 :
+        # No frames of our own, wait until someone wants one
+        if self.requested_ : break
+        self.wake_.wait()
+        continue
+      self.max_sleep_time = 1.0 / rate
+      sleepFor = self.max_sleep_time - ( perf_counter() - self.last_time )
+      if sleepFor <= 0 or not self.wake_.wait( sleepFor ) :
+        break
+
+    self.requested_ = False
+    self.last_time  = perf_counter()
@@ -1,4 +1,5 @@
 from enum import Enum
+from time import perf_counter
 
 import gpiozero as gz
 from luma.lcd.device import st7735 as luma_st7735
@@ -33,6 +34,98 @@ ZAXIS_SLP  = 0
 FAN_CTRL   = 15
 UV_CTRL    = 14
 
+# Wiring of one station, a station's own settings only need what differs
+DEFAULT_SETTINGS = {
+                    "spi"     : {
+                                 "port"       : 0,
+                                 "device"     : 0,
+                                 "busSpeedHz" : 16000000,
+                                 "dc"         : 23, # 25
+                                 "rst"        : 24  # 27
+                                 },
+                    "display" : {
+                                 "width"      : 160,
+                                 "height"     : 128,
+                                 "hOffset"    : 0,
+                                 "vOffset"    : 0,
+                                 "rotate"     : 2
+                                 },
+                    "buttons" : {
+                                 "up"         : KEY_UP_PIN,
+                                 "down"       : KEY_DOWN_PIN,
+                                 "left"       : KEY_LEFT_PIN,
+                                 "right"      : KEY_RIGHT_PIN,
+                                 "press"      : KEY_PRESS_PIN
+                                 },
+                    "fan"     : FAN_CTRL
+                    }
+
+def mergeSettings( defaults, overrides ) :
+  # Nested dicts are merged key by key, anything else in overrides wins
+  merged = dict( defaults )
+  for key, value in overrides.items() :
+    if isinstance( value, dict ) and isinstance( merged.get( key ), dict ) :
+      merged[ key ] = mergeSettings( merged[ key ], value )
+    else :
+      merged[ key ] = value
+  return merged
+
+class DamageFramebuffer( object ) :
+  """luma framebuffer that only sends the boxes it is told changed instead of
+  diffing every frame against the last one"""
+  def __init__( self, rotate=0 ) :
+    self.rotate_ = rotate
+    self.boxes_  = None
+    self.full_   = True
+    # Seconds the display spent sending the parts of the last redraw
+    self.writeTime_ = 0.0
+
+  def damage( self, boxes ) :
+    # ( left, top, right, bottom ) boxes in unrotated display coordinates,
+    # used by the next redraw
+    self.boxes_ = boxes
+
+  def invalidate( self ) :
+    # Send everything next time, e.g. the panel was reset
+    self.full_ = True
+
+  def physical( self, box, width, height ) :
+    # Where a box ends up once luma rotated the image, width and height are
+    # of the rotated image
+    left, top, right, bottom = box
+    if self.rotate_ == 1 :
+      return ( width - bottom, left, width - top, right )
+    elif self.rotate_ == 2 :
+      return ( width - right, height - bottom, width - left, height - top )
+    elif self.rotate_ == 3 :
+      return ( top, height - right, bottom, height - left )
+    return box
+
+  def redraw( self, image ) :
+    # Yields ( image part, bounding box ) for the controller's address window
+    self.writeTime_ = 0.0
+    width, height = image.size
+    if self.full_ or self.boxes_ is None :
+      self.full_  = False
+      self.boxes_ = None
+      sent = perf_counter()
+      yield image, ( 0, 0, width, height )
+      self.writeTime_ += perf_counter() - sent
+      return
+
+    boxes = self.boxes_
+    self.boxes_ = None
+    for box in boxes :
+      left, top, right, bottom = self.physical( box, width, height )
+      box = ( max( left, 0 ), max( top, 0 ), min( right, width ), min( bottom, height ) )
+      if box[0] >= box[2] or box[1] >= box[3] : continue
+      part = image.crop( box )
+      # The display writes each part before asking for the next
+      sent = perf_counter()
+      yield part, box
+      self.writeTime_ += perf_counter() - sent
+
+
 class StepSize( Enum ) :
   FULL    = 1
   HALF    = 2
@@ -41,36 +134,37 @@ class StepSize( Enum ) :
   
 
 class HardwareController( object ) :
-  def __init__( self ) :
+  def __init__( self, settings=None ) :
+    self.settings_ = mergeSettings( DEFAULT_SETTINGS, settings or {} )
+    spi     = self.settings_[ "spi" ]
+    display = self.settings_[ "display" ]
         
     self.spi_    = luma_spi(
-                            port=0,
-                            device=0,
-                            bus_speed_hz=16000000,
+                            port=spi[ "port" ],
+                            device=spi[ "device" ],
+                            bus_speed_hz=spi[ "busSpeedHz" ],
                             cs_high=False,
                             transfer_size=4096,
-                            gpio_DC=23, # 25 
-                            gpio_RST=24 # 27
+                            gpio_DC=spi[ "dc" ],
+                            gpio_RST=spi[ "rst" ]
                            )
       
     self.device_ = luma_st7735(
                                #gpio_LIGHT=24,  #this is failing, idk why
                                #pwm_frequency=200,
                                serial_interface=self.spi_,
-                               width=160,
-                               height=128,
+                               width=display[ "width" ],
+                               height=display[ "height" ],
                                bgr=False,
-                               h_offset=0,
-                               v_offset=0,
-                               rotate=2
+                               h_offset=display[ "hOffset" ],
+                               v_offset=display[ "vOffset" ],
+                               rotate=display[ "rotate" ],
+                               framebuffer=DamageFramebuffer( display[ "rotate" ] )
                               )
     #self.device_ = luma_device.get_device( config )
     self.buttons_ = {}
-    self.buttons_[ "up"    ] = gz.Button( KEY_UP_PIN,    bounce_time=0.05, hold_time=1, hold_repeat=True )
-    self.buttons_[ "down"  ] = gz.Button( KEY_DOWN_PIN,  bounce_time=0.05, hold_time=1, hold_repeat=True )
-    self.buttons_[ "left"  ] = gz.Button( KEY_LEFT_PIN,  bounce_time=0.05, hold_time=1, hold_repeat=True )
-    self.buttons_[ "right" ] = gz.Button( KEY_RIGHT_PIN, bounce_time=0.05, hold_time=1, hold_repeat=True )
-    self.buttons_[ "press" ] = gz.Button( KEY_PRESS_PIN, bounce_time=0.05, hold_time=1, hold_repeat=True )
+    for name, pin in self.settings_[ "buttons" ].items() :
+      self.buttons_[ name ] = gz.Button( pin, bounce_time=0.05, hold_time=1, hold_repeat=True )
 
     self.buttonMap_ = {}
     for key, value in self.buttons_.items() :
@@ -79,5 +173,5 @@ class HardwareController( object ) :
     self.outputs_ = {}
     #self.outputs_[ "zaxis" ] = {}
     #self.outputs_[ "zaxis" ][ "ctrl" ] = gz.PhaseEnableMotor(
-    self.outputs_[ "fan" ] = gz.PWMOutputDevice( FAN_CTRL )
+    self.outputs_[ "fan" ] = gz.PWMOutputDevice( self.settings_[ "fan" ] )
 
@@ -0,0 +1,80 @@
+from PIL import Image
+from luma.core.device import dummy as luma_dummy
+
+import hardware
+
+class DummyPin( object ) :
+  def __init__( self, number ) :
+    self.number = number
+
+
+class DummyButton( object ) :
+  """Stands in for a gpiozero Button, press() fires the handler like the real pin would"""
+  def __init__( self, pin ) :
+    self.pin = DummyPin( pin )
+    self.when_pressed = None
+
+  def press( self ) :
+    if self.when_pressed is not None :
+      self.when_pressed( self )
+
+
+class DummyOutput( object ) :
+  """Stands in for a gpiozero output device"""
+  def __init__( self ) :
+    self.value = 0
+
+
+class HeadlessDevice( luma_dummy ) :
+  """Display that keeps frames in memory. Partial updates are applied to a
+  panel image exactly as the ST7735 would, so it also checks damage tracking"""
+  def __init__( self, width=160, height=128, rotate=0, capture=False ) :
+    super(HeadlessDevice, self).__init__( width=width, height=height, rotate=rotate, mode="RGB" )
+    self.framebuffer = hardware.DamageFramebuffer( rotate )
+    # What the panel shows, in its own unrotated orientation
+    self.panel_       = Image.new( self.mode, ( self._w, self._h ) )
+    self.capture_     = capture
+    self.frames_      = []
+    self.displayed_   = 0
+    self.pixelsSent_  = 0
+
+  def display( self, image ) :
+    assert image.mode == self.mode
+    assert image.size == self.size
+
+    for part, box in self.framebuffer.redraw( self.preprocess( image ) ) :
+      self.panel_.paste( part, box[:2] )
+      self.pixelsSent_ += part.size[0] * part.size[1]
+
+    self.image = image.copy()
+    self.displayed_ += 1
+    if self.capture_ :
+      self.frames_.append( self.image )
+
+  def shown( self ) :
+    # What someone looking at the panel sees, in frame orientation
+    if self.rotate == 0 : return self.panel_.copy()
+    return self.panel_.rotate( self.rotate * 90, expand=True )
+
+
+class HeadlessController( object ) :
+  """Same interface as hardware.HardwareController without any SPI or GPIO"""
+  def __init__( self, settings=None, capture=False ) :
+    self.settings_ = hardware.mergeSettings( hardware.DEFAULT_SETTINGS, settings or {} )
+    display = self.settings_[ "display" ]
+
+    self.device_ = HeadlessDevice( display[ "width" ], display[ "height" ], display[ "rotate" ], capture )
+
+    self.buttons_ = {}
+    for name, pin in self.settings_[ "buttons" ].items() :
+      self.buttons_[ name ] = DummyButton( pin )
+
+    self.buttonMap_ = {}
+    for key, value in self.buttons_.items() :
+      self.buttonMap_[ value.pin.number ] = key
+
+    self.outputs_ = {}
+    self.outputs_[ "fan" ] = DummyOutput()
+
+  def press( self, name ) :
+    self.buttons_[ name ].press()
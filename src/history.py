@@ -0,0 +1,150 @@
+import atexit
+from datetime import datetime
+import json
+import os
+import queue
+import re
+import struct
+import threading
+
+import numpy as np
+
+# One fixed width record per control tick
+RECORD_DTYPE = np.dtype( [
+                          ( "timestamp", "<f8" ),
+                          ( "time",      "<f4" ),
+                          ( "zaxis",     "<f4" ),
+                          ( "fan",       "<f4" ),
+                          ( "lights",    "<f4" ),
+                          ( "mode",      "u1"  )
+                          ] )
+
+# Run file layout :
+#   magic | header length | JSON header | records appended in bulk
+RUN_MAGIC  = b"BAWCSRUN"
+RUN_PREFIX = struct.Struct( "<8sI" )
+
+def readRun( filename ) :
+  # Returns ( header, records ) for a recorded run
+  with open( filename, "rb" ) as f :
+    magic, length = RUN_PREFIX.unpack( f.read( RUN_PREFIX.size ) )
+    if magic != RUN_MAGIC :
+      raise ValueError( filename + " is not a run recording" )
+    header  = json.loads( f.read( length ).decode( "utf-8" ) )
+    records = np.fromfile( f, dtype=RECORD_DTYPE )
+  return header, records
+
+
+class RunRecorder( object ) :
+  """Records every control tick of a run into a preallocated buffer and flushes it to disk in bulk"""
+  def __init__( self, folder="history", capacity=4096 ) :
+    self.folder_   = folder
+    # Ticks fill one buffer while the writer thread writes out the other
+    self.buffer_   = np.zeros( capacity, dtype=RECORD_DTYPE )
+    self.spare_    = np.zeros( capacity, dtype=RECORD_DTYPE )
+    self.count_    = 0
+    self.file_     = None
+    self.filename_ = None
+    # Ticks come from the timer thread, start/stop from buttons and Blynk
+    self.lock_     = threading.RLock()
+
+    # ( file, records or None to close it ) for the writer thread, ticks
+    # hold the renderer's lock so they never wait on the disk themselves
+    self.pending_  = queue.Queue()
+    self.spareFree_ = threading.Event()
+    self.spareFree_.set()
+    self.writer_   = threading.Thread( target=self.writeLoop, name="history", daemon=True )
+    self.writer_.start()
+    atexit.register( self.drain )
+
+  def recording( self ) :
+    return self.file_ is not None
+
+  def start( self, profileName, mode ) :
+    self.lock_.acquire()
+    self.stop()
+    try :
+      os.makedirs( self.folder_, exist_ok=True )
+      started = datetime.now()
+      safeName = re.sub( r"[^A-Za-z0-9_-]+", "_", profileName )
+      stem = os.path.join( self.folder_, started.strftime( "%Y%m%d-%H%M%S" ) + "-" + safeName )
+
+      header = {
+                "profile" : profileName,
+                "mode"    : mode.name,
+                "started" : started.isoformat(),
+                "dtype"   : RECORD_DTYPE.descr
+                }
+      raw = json.dumps( header ).encode( "utf-8" )
+      # Never write over another run, even one started the same second
+      self.filename_ = stem + ".run"
+      suffix = 1
+      while self.file_ is None :
+        try :
+          self.file_ = open( self.filename_, "xb" )
+        except FileExistsError :
+          self.filename_ = stem + "-" + str( suffix ) + ".run"
+          suffix += 1
+      self.file_.write( RUN_PREFIX.pack( RUN_MAGIC, len( raw ) ) )
+      self.file_.write( raw )
+      self.count_ = 0
+      print( "Recording run to " + self.filename_ )
+    except IOError as e :
+      print( "WARNING: Could not start run recording : " + str( e ) )
+      self.file_ = None
+    self.lock_.release()
+
+  def record( self, timestamp, time, data, mode ) :
+    self.lock_.acquire()
+    if self.file_ is None :
+      self.lock_.release()
+      return
+
+    self.buffer_[ self.count_ ] = ( timestamp, time, data.get( "zaxis", 0 ), data.get( "fan", 0 ), data.get( "lights", 0 ), mode.value )
+    self.count_ += 1
+
+    if self.count_ == self.buffer_.shape[0] :
+      self.flush()
+    self.lock_.release()
+
+  def flush( self ) :
+    # Hand what we have to the writer thread and carry on in the other buffer
+    self.lock_.acquire()
+    if self.file_ is not None and self.count_ > 0 :
+      # Only waits if the disk is a whole buffer behind
+      self.spareFree_.wait()
+      self.spareFree_.clear()
+      self.pending_.put( ( self.file_, self.buffer_[ :self.count_ ] ) )
+      self.buffer_, self.spare_ = self.spare_, self.buffer_
+      self.count_ = 0
+    self.lock_.release()
+
+  def stop( self ) :
+    self.lock_.acquire()
+    if self.file_ is not None :
+      self.flush()
+      self.pending_.put( ( self.file_, None ) )
+      self.file_ = None
+      print( "Run recorded to " + self.filename_ )
+    self.lock_.release()
+
+  def drain( self ) :
+    # Wait until everything handed to the writer is on disk
+    self.pending_.join()
+
+  def writeLoop( self ) :
+    while True :
+      runFile, records = self.pending_.get()
+      try :
+        if records is None :
+          runFile.close()
+        else :
+          # One large append instead of a write per tick
+          runFile.write( records.tobytes() )
+          runFile.flush()
+      except IOError as e :
+        print( "WARNING: Could not write run recording : " + str( e ) )
+      finally :
+        if records is not None :
+          self.spareFree_.set()
+        self.pending_.task_done()
@@ -0,0 +1,225 @@
+import collections
+import glob
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+
+# Compiled profile layout :
+#   magic | version | header length | JSON header | ( padding to 8 bytes | data block ) per block
+COMPILED_MAGIC   = b"BAWCSCFG"
+COMPILED_VERSION = 6
+COMPILED_PREFIX  = struct.Struct( "<8sII" )
+COMPILED_ALIGN   = 8
+
+def compiledName( filename ) :
+  # Lives next to the source, but does not match the *.cfg glob
+  return filename + "c"
+
+def writeCompiled( filename, header, blocks ) :
+  # header is anything JSON serializable, blocks are written as is and their
+  # shapes and dtypes are added to the header
+  blocks = [ np.ascontiguousarray( block ) for block in blocks ]
+  header = dict( header, blocks=[ { "shape" : list( block.shape ), "dtype" : block.dtype.str } for block in blocks ] )
+
+  raw     = json.dumps( header ).encode( "utf-8" )
+  start   = COMPILED_PREFIX.size + len( raw )
+
+  # Per process so stations sharing a folder never write the same temporary
+  tmpname = filename + "." + str( os.getpid() ) + ".tmp"
+  try :
+    with open( tmpname, "wb" ) as f :
+      f.write( COMPILED_PREFIX.pack( COMPILED_MAGIC, COMPILED_VERSION, len( raw ) ) )
+      f.write( raw )
+      for block in blocks :
+        padding = ( -start ) % COMPILED_ALIGN
+        f.write( b"\0" * padding )
+        f.write( block.tobytes() )
+        start += padding + block.nbytes
+    os.replace( tmpname, filename )
+  except IOError as e :
+    print( "WARNING: Could not write compiled profile " + filename + " : " + str( e ) )
+
+def readCompiled( filename, digest ) :
+  # Returns ( header, blocks ) with blocks memory-mapped, or None if missing
+  # or built from a different source
+  try :
+    with open( filename, "rb" ) as f :
+      magic, version, length = COMPILED_PREFIX.unpack( f.read( COMPILED_PREFIX.size ) )
+      if magic != COMPILED_MAGIC or version != COMPILED_VERSION : return None
+      header = json.loads( f.read( length ).decode( "utf-8" ) )
+  except ( IOError, ValueError, struct.error ) :
+    return None
+
+  if header.get( "hash" ) != digest : return None
+
+  blocks = []
+  start  = COMPILED_PREFIX.size + length
+  for layout in header[ "blocks" ] :
+    start += ( -start ) % COMPILED_ALIGN
+    shape  = tuple( layout[ "shape" ] )
+    dtype  = np.dtype( layout[ "dtype" ] )
+    if 0 in shape :
+      blocks.append( np.zeros( shape, dtype=dtype ) )
+      continue
+
+    try :
+      block = np.memmap( filename, dtype=dtype, mode="r", offset=start, shape=shape )
+    except ( IOError, ValueError ) :
+      return None
+    blocks.append( block )
+    start += block.nbytes
+  return header, blocks
+
+class ProfileIndex( object ) :
+  """Names and metadata of every profile in a folder, persisted between boots"""
+  def __init__( self, folder, filename=".index.json" ) :
+    self.folder_   = folder
+    self.filename_ = os.path.join( folder, filename )
+    self.entries_  = {}
+    self.dirty_    = False
+
+  def load( self ) :
+    try :
+      self.entries_ = json.load( open( self.filename_ ) )
+    except ( IOError, ValueError ) :
+      # Missing or corrupt, we will just rebuild it
+      self.entries_ = {}
+
+  def save( self ) :
+    if not self.dirty_ : return
+    try :
+      tmpname = self.filename_ + "." + str( os.getpid() ) + ".tmp"
+      with open( tmpname, "w" ) as f :
+        json.dump( self.entries_, f )
+      os.replace( tmpname, self.filename_ )
+      self.dirty_ = False
+    except IOError as e :
+      print( "WARNING: Could not save profile index : " + str( e ) )
+
+  def parse( self, filename, stat ) :
+    # Only place we look inside a file, and only when it changed on disk
+    raw = json.load( open( filename ) )
+    if "stages" in raw :
+      # Composite, the datasets only exist once its stages are compiled
+      return {
+              "mtime"    : stat.st_mtime_ns,
+              "size"     : stat.st_size,
+              "name"     : raw[ "name" ],
+              "stages"   : [ stage[ "profile" ] for stage in raw[ "stages" ] ]
+              }
+    return {
+            "mtime"    : stat.st_mtime_ns,
+            "size"     : stat.st_size,
+            "name"     : raw[ "name" ],
+            "channels" : [ data[ "name" ] for data in raw[ "datasets" ] ],
+            "points"   : sum( [ len( data[ "time" ] ) for data in raw[ "datasets" ] ] )
+            }
+
+  def scan( self, hold=() ) :
+    # Cheap stat of every profile in the folder, only files whose mtime or size
+    # changed are parsed again. Returns ( added, changed, removed ) filenames,
+    # anything in hold is left as it was so it shows up again on a later scan
+    files   = sorted( glob.glob( os.path.join( self.folder_, "*.cfg" ) ) )
+    entries = {}
+    added   = []
+    changed = []
+    removed = []
+    for cfg in files :
+      key   = os.path.basename( cfg )
+      try :
+        stat  = os.stat( cfg )
+      except OSError :
+        # Deleted between the glob and now
+        continue
+      entry = self.entries_.get( key )
+
+      if cfg in hold and entry is not None :
+        pass
+      elif entry is None or entry[ "mtime" ] != stat.st_mtime_ns or entry[ "size" ] != stat.st_size :
+        try :
+          newEntry = self.parse( cfg, stat )
+        except ( IOError, ValueError, KeyError ) as e :
+          print( "ERROR: Could not index " + cfg + " : " + str( e ) )
+          # Remember it is bad so we do not retry until it changes again
+          newEntry = { "mtime" : stat.st_mtime_ns, "size" : stat.st_size, "name" : None }
+
+        if entry is None or entry[ "name" ] is None :
+          if newEntry[ "name" ] is not None : added.append( cfg )
+        elif newEntry[ "name" ] is None :
+          # Broken edit of a good profile, drop it until it is fixed
+          removed.append( cfg )
+        else :
+          changed.append( cfg )
+        entry = newEntry
+        self.dirty_ = True
+
+      entries[ key ] = entry
+
+    for key, entry in self.entries_.items() :
+      cfg = os.path.join( self.folder_, key )
+      if key not in entries :
+        if cfg in hold :
+          entries[ key ] = entry
+        else :
+          self.dirty_ = True
+          if entry[ "name" ] is not None : removed.append( cfg )
+
+    self.entries_ = entries
+    self.save()
+
+    return added, changed, removed
+
+  def files( self ) :
+    # Returns [ ( filename, entry ) ] for every good profile, in filename order
+    return [ ( os.path.join( self.folder_, key ), self.entries_[ key ] )
+             for key in sorted( self.entries_.keys() )
+             if self.entries_[ key ][ "name" ] is not None ]
+
+
+class ProfileCache( object ) :
+  """LRU of fully loaded profiles, capped by the memory their datasets take"""
+  def __init__( self, maxBytes=16 * 1024 * 1024 ) :
+    self.maxBytes_ = maxBytes
+    self.loaded_   = collections.OrderedDict()
+    self.lock_     = threading.Lock()
+
+  def size( self ) :
+    return sum( self.loaded_.values() )
+
+  def acquire( self, config ) :
+    # Make sure config is loaded and mark it most recently used, None if it
+    # cannot be loaded e.g. a composite whose stage was deleted
+    if config.error_ is not None : return None
+    self.lock_.acquire()
+
+    try :
+      if config in self.loaded_ :
+        self.loaded_.move_to_end( config )
+      else :
+        if not config.isLoaded() :
+          try :
+            config.load()
+          except ( IOError, ValueError, KeyError ) as e :
+            print( "ERROR: Could not load " + str( config.filename_ ) + " : " + str( e ) )
+            config.unload()
+            config.error_ = str( e )
+            return None
+        self.loaded_[ config ] = config.nbytes()
+
+      # Evict the oldest, but never what was just asked for
+      while self.size() > self.maxBytes_ and len( self.loaded_ ) > 1 :
+        oldest, nbytes = self.loaded_.popitem( last=False )
+        print( "Unloading " + oldest.name_ + " [ " + str( nbytes ) + " bytes ]" )
+        oldest.unload()
+    finally :
+      self.lock_.release()
+
+    return config
+
+  def discard( self, config ) :
+    self.lock_.acquire()
+    self.loaded_.pop( config, None )
+    self.lock_.release()
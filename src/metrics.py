@@ -0,0 +1,97 @@
+import threading
+from time import perf_counter
+
+# Stages of a frame, in the order Renderer.render() goes through them
+STAGES = [
+          "background", # cached widget layer copied into a new frame
+          "widgets",    # readouts updated and drawn
+          "graph",      # traces and cursor
+          "sprites",    # setup and build plate pasted over everything
+          "damage",     # changed boxes collected from the widgets
+          "digest",     # frame hashed to skip resending it
+          "convert",    # luma rotating the frame and converting each part
+          "spi",        # parts written to the display
+          "frame"       # all of the above
+          ]
+
+# Bucket n holds times under 2^n microseconds, the last one everything longer
+BUCKETS = 24
+
+class StageHistogram( object ) :
+  """Fixed size log2 histogram of one stage's times"""
+  def __init__( self ) :
+    self.counts_ = [ 0 ] * BUCKETS
+    self.count_  = 0
+    self.total_  = 0.0
+    self.max_    = 0.0
+
+  def record( self, seconds ) :
+    self.counts_[ min( int( seconds * 1e6 ).bit_length(), BUCKETS - 1 ) ] += 1
+    self.count_ += 1
+    self.total_ += seconds
+    if seconds > self.max_ :
+      self.max_ = seconds
+
+  def percentile( self, share ) :
+    # Upper edge in ms of the bucket the share of times fall under
+    if self.count_ == 0 : return 0.0
+    seen = 0
+    for bucket, count in enumerate( self.counts_ ) :
+      seen += count
+      if seen >= share * self.count_ :
+        return min( 2 ** bucket / 1000.0, self.max_ * 1000.0 )
+    return self.max_ * 1000.0
+
+  def summary( self ) :
+    return {
+            "count" : self.count_,
+            "mean"  : 1000.0 * self.total_ / self.count_ if self.count_ > 0 else 0.0,
+            "p50"   : self.percentile( 0.5 ),
+            "p90"   : self.percentile( 0.9 ),
+            "p99"   : self.percentile( 0.99 ),
+            "max"   : 1000.0 * self.max_
+            }
+
+
+class FrameMetrics( object ) :
+  """Time spent in every stage of rendering a frame"""
+  def __init__( self ) :
+    self.lock_   = threading.Lock()
+    self.stages_ = {}
+    self.reset()
+
+  def reset( self ) :
+    with self.lock_ :
+      for stage in STAGES :
+        self.stages_[ stage ] = StageHistogram()
+
+  def lap( self, stage, mark ) :
+    # Record the time since mark against stage, returns the new mark
+    now = perf_counter()
+    self.record( stage, now - mark )
+    return now
+
+  def record( self, stage, seconds ) :
+    with self.lock_ :
+      self.stages_[ stage ].record( seconds )
+
+  def summary( self ) :
+    # { stage : { count, mean, p50, p90, p99, max } } in ms
+    with self.lock_ :
+      return { stage : self.stages_[ stage ].summary() for stage in STAGES }
+
+  def report( self, frames=None ) :
+    # Lines of text, frames is Renderer.frameStats() if the counts are wanted
+    lines = [ "{0: <10} {1: >7} {2: >8} {3: >8} {4: >8} {5: >8}".format( "stage", "count", "mean ms", "p50", "p99", "max" ) ]
+    for stage, summary in self.summary().items() :
+      lines.append( "{0: <10} {1: >7} {2: >8.3f} {3: >8.3f} {4: >8.3f} {5: >8.3f}".format(
+                                                                                          stage,
+                                                                                          summary[ "count" ],
+                                                                                          summary[ "mean" ],
+                                                                                          summary[ "p50" ],
+                                                                                          summary[ "p99" ],
+                                                                                          summary[ "max" ]
+                                                                                          ) )
+    if frames is not None :
+      lines.append( "frames sent {0} skipped {1}".format( frames[ "sent" ], frames[ "skipped" ] ) )
+    return lines
@@ -1,16 +1,135 @@
+from collections import namedtuple
 from enum import Enum
-import glob
+import hashlib
 import json
+import os
 import sys
+import time
+import types
 import numpy as np
 
+import library
+
 # What State the hardware control is in
 class ControlModes( Enum ) :
   AUTO_RUN = 0
   MANUAL   = 1
+
+# How a dataset gets from one breakpoint to the next
+class Interpolation( Enum ) :
+  STEP   = "step"
+  LINEAR = "linear"
+  CUBIC  = "cubic"
+
+# Order channels are returned in when evaluating a whole profile at once
+CHANNELS = [ "zaxis", "fan", "lights" ]
+
+# Rows of the packed per profile block, channels sit side by side in it
+ROWS = [ "value", "slope", "quadratic", "cubic", "cumulative" ]
+PROFILE_DTYPE = np.float32
+# Breakpoint times are kept apart at full precision, float32 cannot tell
+# dense breakpoints a few minutes into a profile apart well enough
+TIME_DTYPE = np.float64
+
+# Immutable summaries computed once when a profile is loaded or edited
+ChannelSummary = namedtuple( "ChannelSummary", [ "minValue", "maxValue", "firstTime", "lastTime", "firstValue", "lastValue", "integral" ] )
+ProfileSummary = namedtuple( "ProfileSummary", [ "totalTime", "channels" ] )
     
 
+def stageFilename( filename, stage ) :
+  # Stages are referenced relative to the composite profile
+  return os.path.join( os.path.dirname( filename ), stage[ "profile" ] )
+
+def profileDigest( filename, parents=() ) :
+  # Returns ( source, sha1, raw ), composite profiles fold in the hash of every
+  # stage they reference so editing a stage rebuilds the composite too.
+  # raw is only parsed if we had to look inside
+  if filename in parents :
+    raise ValueError( "Profile " + filename + " includes itself" )
+
+  source = open( filename, "rb" ).read()
+  digest = hashlib.sha1( source )
+  raw    = None
+  if b'"stages"' in source :
+    raw = json.loads( source.decode( "utf-8" ) )
+    for stage in raw.get( "stages", [] ) :
+      digest.update( profileDigest( stageFilename( filename, stage ), parents + ( filename, ) )[1].encode( "utf-8" ) )
+  return source, digest.hexdigest(), raw
+
+def decimate( time, value, bucketWidth ) :
+  # Min/max bucketing, keeps the lowest and highest point of every bucket
+  # plus both ends so the plot envelope and edge interpolation are unchanged
+  count = time.shape[0]
+  if count == 0 or bucketWidth <= 0 or count <= 2 * ( ( time[-1] - time[0] ) / bucketWidth + 1 ) :
+    return np.array( ( time, value ) )
+
+  buckets = np.floor( ( time - time[0] ) / bucketWidth ).astype( int )
+  order   = np.lexsort( ( value, buckets ) )
+  edges   = np.flatnonzero( np.diff( buckets[ order ] ) )
+  lows    = order[ np.concatenate( ( [ 0 ], edges + 1 ) ) ]
+  highs   = order[ np.concatenate( ( edges, [ count - 1 ] ) ) ]
+
+  keep = np.unique( np.concatenate( ( [ 0, count - 1 ], lows, highs ) ) )
+  return np.array( ( time[ keep ], value[ keep ] ) )
+
+def monotoneTangents( time, value ) :
+  # Fritsch-Carlson tangents, the cubic through them never overshoots the
+  # breakpoints so a lift or ramp cannot go past where it was told to
+  count   = time.shape[0]
+  dt      = np.diff( time )
+  secants = np.divide( np.diff( value ), dt, out=np.zeros( dt.shape ), where=( dt > 0 ) )
+
+  tangents = np.zeros( count )
+  tangents[0]    = secants[0]
+  tangents[-1]   = secants[-1]
+  tangents[1:-1] = 0.5 * ( secants[:-1] + secants[1:] )
+  # Flat at local extrema and next to flat segments
+  tangents[1:-1][ secants[:-1] * secants[1:] <= 0 ] = 0.0
+
+  flat  = secants == 0
+  alpha = np.divide( tangents[:-1], secants, out=np.zeros( secants.shape ), where=~flat )
+  beta  = np.divide( tangents[1:],  secants, out=np.zeros( secants.shape ), where=~flat )
+  tangents[:-1][ flat ] = 0.0
+  tangents[1:][ flat ]  = 0.0
+
+  # Pull tangents back inside the monotone region. Neighbouring segments
+  # share a tangent so it takes the smaller scale of the two, shrinking one
+  # end never pushes the other segment back out
+  radius = np.hypot( alpha, beta )
+  tau    = np.divide( 3.0, radius, out=np.ones( radius.shape ), where=( radius > 3.0 ) )
+  scale  = np.ones( count )
+  scale[:-1] = np.minimum( scale[:-1], tau )
+  scale[1:]  = np.minimum( scale[1:], tau )
+  return tangents * scale
+
+
+def segmentCoefficients( time, value, interp ) :
+  # ( slope, quadratic, cubic ) of every segment between the breakpoints, each
+  # segment is value + slope * dt + quadratic * dt^2 + cubic * dt^3
+  dt = np.diff( time )
+  secants = np.divide( np.diff( value ), dt, out=np.zeros( dt.shape ), where=( dt > 0 ) )
+  slope     = np.zeros( dt.shape )
+  quadratic = np.zeros( dt.shape )
+  cubic     = np.zeros( dt.shape )
+
+  if interp == Interpolation.LINEAR :
+    slope = secants
+  elif interp == Interpolation.CUBIC and dt.shape[0] > 0 :
+    # Hermite segments through the breakpoints with monotone tangents
+    tangents = monotoneTangents( time, value )
+    left  = tangents[:-1]
+    right = tangents[1:]
+    slope     = np.where( dt > 0, left, 0.0 )
+    quadratic = np.divide( 3.0 * secants - 2.0 * left - right, dt, out=np.zeros( dt.shape ), where=( dt > 0 ) )
+    cubic     = np.divide( left + right - 2.0 * secants, dt * dt, out=np.zeros( dt.shape ), where=( dt > 0 ) )
+  # Step holds each value until the next breakpoint, nothing but the value
+  return slope, quadratic, cubic
+
+
 class DataSet( object ) :
+  __slots__ = [ "name_", "time_", "value_", "lineColor_", "pointColor_", "max_", "min_", "interp_", "runs_",
+                "slope_", "quadratic_", "cubic_", "cumulative_", "cursor_", "decimated_", "start_", "count_" ]
+
   def __init__( self, name ) :
     self.name_  = name
     self.time_  = np.zeros( (0) )
@@ -22,36 +141,477 @@ class DataSet( object ) :
     # but the expected absolute max of the system
     self.max_   = 1
     self.min_   = 0
+    self.interp_ = Interpolation.LINEAR
+    # [ ( first segment, interpolation ) ] when segments do not all use
+    # interp_, e.g. a composite of stages written in different modes
+    self.runs_   = []
+
+    # Per segment polynomial coefficients, filled in by compile(). Every mode
+    # is value + slope * dt + quadratic * dt^2 + cubic * dt^3 from the start
+    # of the segment so lookups do not care which one it is
+    self.slope_     = np.zeros( (0) )
+    self.quadratic_ = np.zeros( (0) )
+    self.cubic_     = np.zeros( (0) )
+    # Integral of the data from the first breakpoint up to each breakpoint
+    self.cumulative_ = np.zeros( (0) )
+    # Segment the last lookup landed in, time only moves forward while running
+    self.cursor_ = 0
+
+    # Display ready copies of the data keyed by seconds per pixel
+    self.decimated_ = {}
+
+    # Where this dataset lives in its profile's packed block
+    self.start_ = 0
+    self.count_ = 0
 
   def normalize( self, value ) :
     return ( value - self.min_ ) / ( self.max_ - self.min_ )
+
+  def runs( self ) :
+    # [ ( first segment, end segment, interpolation ) ] covering every segment
+    segments = max( self.time_.shape[0] - 1, 0 )
+    starts   = self.runs_ or [ ( 0, self.interp_ ) ]
+    ends     = [ first for first, interp in starts[1:] ] + [ segments ]
+    return [ ( first, end, interp ) for ( first, interp ), end in zip( starts, ends ) ]
+
+  def compile( self ) :
+    # Precompute the coefficients of every segment once, so a lookup is a
+    # couple of multiply-adds whatever the interpolation. Each run is
+    # compiled on its own, as if it were a dataset of its own
+    dt = np.diff( self.time_ )
+    self.slope_     = np.zeros( dt.shape )
+    self.quadratic_ = np.zeros( dt.shape )
+    self.cubic_     = np.zeros( dt.shape )
+    for first, end, interp in self.runs() :
+      if end <= first : continue
+      span = slice( first, end )
+      self.slope_[ span ], self.quadratic_[ span ], self.cubic_[ span ] = segmentCoefficients( self.time_[ first : end + 1 ], self.value_[ first : end + 1 ], interp )
+
+    # Exact integral of each segment's polynomial
+    area = dt * ( self.value_[:-1] + dt * ( self.slope_ / 2.0 + dt * ( self.quadratic_ / 3.0 + dt * self.cubic_ / 4.0 ) ) )
+    self.cumulative_ = np.concatenate( ( [ 0.0 ], np.cumsum( area ) ) ) if self.time_.shape[0] > 0 else np.zeros( (0) )
+    self.cursor_ = 0
+    self.decimated_ = {}
+
+  def decimated( self, secPerPixel, pointsPerPixel=2 ) :
+    # ( time, value ) array reduced to the min and max of every pixel column,
+    # which is all a line plot at this zoom can show anyway
+    if secPerPixel not in self.decimated_ :
+      time, value = self.traced( secPerPixel / pointsPerPixel )
+      self.decimated_[ secPerPixel ] = decimate( time, value, secPerPixel / ( pointsPerPixel / 2 ) )
+    return self.decimated_[ secPerPixel ]
+
+  def traced( self, spacing ) :
+    # Points that drawn as straight lines follow the interpolated shape
+    runs = self.runs()
+    if len( runs ) == 1 :
+      return self.tracedRun( self.time_, self.value_, runs[0][2], spacing )
+
+    # Runs share their end breakpoints, keep only one of each
+    times  = []
+    values = []
+    for first, end, interp in runs :
+      time, value = self.tracedRun( self.time_[ first : end + 1 ], self.value_[ first : end + 1 ], interp, spacing )
+      skip = 1 if len( times ) > 0 else 0
+      times.append( time[ skip: ] )
+      values.append( value[ skip: ] )
+    return np.concatenate( times ), np.concatenate( values )
+
+  def tracedRun( self, time, value, interp, spacing ) :
+    if interp == Interpolation.STEP and time.shape[0] > 1 :
+      # Add the corner before every breakpoint
+      return np.repeat( time, 2 )[1:], np.repeat( value, 2 )[:-1]
+    if interp == Interpolation.CUBIC and time.shape[0] > 1 and spacing > 0 :
+      time = np.union1d( time, np.arange( time[0], time[-1], spacing ) )
+      return time, self.evaluate( time )
+    return time, value
+
+  def seek( self, time ) :
+    # Binary search for the segment containing time, used when we jump around
+    self.cursor_ = int( np.searchsorted( self.time_, time, side="right" ) ) - 1
+    self.cursor_ = min( max( self.cursor_, 0 ), self.time_.shape[0] - 2 )
+
+  def valueAt( self, time ) :
+    # Same result as evaluate() for a single time but O(1) amortized for
+    # forward moving time, and a plain float
+    count = self.time_.shape[0]
+    if count == 0 : return 0.0
+    if count == 1 or time <= self.time_[0] : return float( self.value_[0] )
+    if time >= self.time_[-1] : return float( self.value_[-1] )
+
+    idx = self.locate( time )
+    value, slope, quadratic, cubic = self.coefficients( idx )
+    dt  = time - float( self.time_[ idx ] )
+    return value + dt * ( slope + dt * ( quadratic + dt * cubic ) )
+
+  def coefficients( self, idx ) :
+    # As plain floats, numpy would otherwise do the math in the packed float32
+    return float( self.value_[ idx ] ), float( self.slope_[ idx ] ), float( self.quadratic_[ idx ] ), float( self.cubic_[ idx ] )
+
+  def evaluate( self, times ) :
+    # Vectorized valueAt over an array of times, holding the end values
+    # outside the breakpoints
+    times = np.asarray( times, dtype=float )
+    count = self.time_.shape[0]
+    if count == 0 : return np.zeros( times.shape )
+    if count == 1 : return np.full( times.shape, float( self.value_[0] ) )
+
+    idx = np.clip( np.searchsorted( self.time_, times, side="right" ) - 1, 0, count - 2 )
+    dt  = np.clip( times, self.time_[0], self.time_[-1] ) - self.time_[ idx ]
+    values = self.value_[ idx ] + dt * ( self.slope_[ idx ] + dt * ( self.quadratic_[ idx ] + dt * self.cubic_[ idx ] ) )
+    # Past the end the last segment would still be a step away
+    return np.where( times >= self.time_[-1], float( self.value_[-1] ), values )
+
+  def integralAt( self, time ) :
+    # Integral of the data from 0 to time, holding the end values outside the
+    # breakpoints like valueAt does. O(1) amortized same as valueAt
+    return self.integralFromStart( time ) - self.integralFromStart( 0.0 )
+
+  def integralFromStart( self, time ) :
+    # Integral from the first breakpoint, negative before it
+    count = self.time_.shape[0]
+    if count == 0 : return 0.0
+    if count == 1 or time <= self.time_[0] : return float( self.value_[0] ) * ( time - float( self.time_[0] ) )
+    if time >= self.time_[-1] : return float( self.cumulative_[-1] ) + float( self.value_[-1] ) * ( time - float( self.time_[-1] ) )
+
+    idx = self.locate( time )
+    value, slope, quadratic, cubic = self.coefficients( idx )
+    dt  = time - float( self.time_[ idx ] )
+    return float( self.cumulative_[ idx ] ) + dt * ( value + dt * ( slope / 2.0 + dt * ( quadratic / 3.0 + dt * cubic / 4.0 ) ) )
+
+  def locate( self, time ) :
+    # Segment index containing time, which must be inside the breakpoints
+    if self.cursor_ >= self.time_.shape[0] - 1 or time < self.time_[ self.cursor_ ] :
+      # We went backwards (scrubbing), or the cursor is stale
+      self.seek( time )
+    else :
+      # Walk forward a few segments, anything further is a jump so search
+      steps = 0
+      while time >= self.time_[ self.cursor_ + 1 ] :
+        self.cursor_ += 1
+        steps += 1
+        if steps > 4 :
+          self.seek( time )
+          break
+
+    return self.cursor_
     
         
+class ProfileClock( object ) :
+  """Profile time derived from monotonic clock deltas, so slow ticks do not drift"""
+  def __init__( self, source=time.monotonic ) :
+    self.source_ = source
+    # Source time at which the profile was at zero, None while paused
+    self.origin_ = None
+    self.paused_ = 0.0
+
+  def running( self ) :
+    return self.origin_ is not None
+
+  def resume( self, at ) :
+    self.origin_ = self.source_() - at
+
+  def pause( self ) :
+    self.paused_ = self.now()
+    self.origin_ = None
+    return self.paused_
+
+  def seek( self, at ) :
+    # Jump to a profile time, keeps running if we were
+    if self.running() :
+      self.resume( at )
+    else :
+      self.paused_ = at
+
+  def now( self ) :
+    if self.running() :
+      return self.source_() - self.origin_
+    return self.paused_
+
+
 class Configuration( object ) :
+  __slots__ = [ "name_", "filename_", "datasets_", "summary_", "loaded_", "data_", "times_", "channels_", "error_" ]
+
   def __init__( self, name ) :
     self.name_ = name
     self.filename_ = None
     self.datasets_ = {}
+    self.summary_  = ProfileSummary( 0, types.MappingProxyType( {} ) )
+    self.loaded_   = False
+
+    # Every channel packed in one ( ROWS x points ) block, plus their times
+    self.data_     = np.zeros( ( len( ROWS ), 0 ), dtype=PROFILE_DTYPE )
+    self.times_    = np.zeros( (0), dtype=TIME_DTYPE )
+    # ( name, dataset ) in CHANNELS order, resolved once so ticks do no lookups
+    self.channels_ = []
+    # Why the last load failed, not retried until the file is indexed again
+    self.error_    = None
     
-  def loadFile( self, filename ) :
+  def loadIndex( self, filename, entry ) :
+    # Metadata only, datasets are read on first use with load()
+    self.name_     = entry[ "name" ]
+    self.filename_ = filename
+    self.loaded_   = False
+    self.error_    = None
+
+  def isLoaded( self ) :
+    return self.loaded_
+
+  def load( self ) :
+    self.loadFile( self.filename_ )
+
+  def unload( self ) :
+    self.datasets_ = {}
+    self.summary_  = ProfileSummary( 0, types.MappingProxyType( {} ) )
+    self.loaded_   = False
+    self.data_     = np.zeros( ( len( ROWS ), 0 ), dtype=PROFILE_DTYPE )
+    self.times_    = np.zeros( (0), dtype=TIME_DTYPE )
+    self.channels_ = []
+
+  def nbytes( self ) :
+    return self.data_.nbytes + self.times_.nbytes
+
+  def pack( self ) :
+    # Copy every dataset into one contiguous block and point the datasets at it
+    total = sum( [ dataset.time_.shape[0] for name, dataset in self.datasets_.items() ] )
+    block = np.zeros( ( len( ROWS ), total ), dtype=PROFILE_DTYPE )
+    times = np.zeros( total, dtype=TIME_DTYPE )
+
+    start = 0
+    for name, dataset in self.datasets_.items() :
+      count = dataset.time_.shape[0]
+      times[ start : start + count ] = dataset.time_
+      block[ 0, start : start + count ] = dataset.value_
+      # Coefficients are per segment, the last breakpoint's are never used
+      block[ 1, start : start + count - 1 ] = dataset.slope_[ : max( count - 1, 0 ) ]
+      block[ 2, start : start + count - 1 ] = dataset.quadratic_[ : max( count - 1, 0 ) ]
+      block[ 3, start : start + count - 1 ] = dataset.cubic_[ : max( count - 1, 0 ) ]
+      block[ 4, start : start + count ] = dataset.cumulative_
+      dataset.start_ = start
+      dataset.count_ = count
+      start += count
+
+    self.attach( block, times )
+
+  def attach( self, block, times ) :
+    # Datasets become views into block and times, nothing is copied
+    self.data_  = block
+    self.times_ = times
+    for name, dataset in self.datasets_.items() :
+      span = slice( dataset.start_, dataset.start_ + dataset.count_ )
+      dataset.time_       = times[ span ]
+      dataset.value_      = block[ 0, span ]
+      dataset.slope_      = block[ 1, span ]
+      dataset.quadratic_  = block[ 2, span ]
+      dataset.cubic_      = block[ 3, span ]
+      dataset.cumulative_ = block[ 4, span ]
+
+    self.channels_ = [ ( name, self.datasets_[ name ] ) for name in CHANNELS if name in self.datasets_ ]
+    self.channels_ += [ ( name, dataset ) for name, dataset in self.datasets_.items() if name not in CHANNELS ]
+
+  def loadFile( self, filename, parents=() ) :
     print( "Loading " + filename + "..." )
-    raw = json.load( open( filename ) )
+    source, digest, raw = profileDigest( filename, parents )
+
+    # Only the source hash decides if the compiled form is still good
+    if not self.loadCompiled( library.compiledName( filename ), digest ) :
+      if raw is None :
+        raw = json.loads( source.decode( "utf-8" ) )
+
+      if "stages" in raw :
+        self.loadStages( raw, filename, parents )
+      else :
+        self.loadJson( raw )
+      self.invalidate()
+      self.saveCompiled( library.compiledName( filename ), digest )
+  
+    self.filename_ = filename
+    self.loaded_   = True
+
+  def loadJson( self, raw ) :
     self.name_ = raw["name"]
+    self.datasets_ = {}
 
     for data in raw["datasets" ] :
       dataset = DataSet( data["name"] )
-      dataset.time_  = np.array( data["time"] )
-      dataset.value_ = np.array( data["value"] )
+      dataset.time_  = np.array( data["time"], dtype=float )
+      dataset.value_ = np.array( data["value"], dtype=float )
       dataset.min_   = data["min"]
       dataset.max_   = data["max"]
       if "lineColor" in data :
         dataset.lineColor_ = data["lineColor"]
       if "pointColor" in data :
         dataset.pointColor_ = data["pointColor"]
+      if "interp" in data :
+        try :
+          dataset.interp_ = Interpolation( data["interp"] )
+        except ValueError :
+          print( "WARNING: Unknown interpolation " + str( data["interp"] ) + " for " + dataset.name_ + ", using linear" )
       self.datasets_[dataset.name_] = dataset
-     
-  
-    self.filename_ = filename
+
+  def loadStages( self, raw, filename, parents=() ) :
+    # Compile a composite profile into one flat timeline. Each stage starts
+    # where the previous one ended plus its offset, spent with everything at
+    # its minimum, and can be repeated and scaled in time and per channel
+    self.name_ = raw["name"]
+    self.datasets_ = {}
+
+    stages = []
+    for stage in raw["stages"] :
+      sub = Configuration( "stage" )
+      sub.loadFile( stageFilename( filename, stage ), parents + ( filename, ) )
+      stages.append( ( sub, stage ) )
+
+      # Channel metadata comes from the first stage that has it
+      for name, dataset in sub.datasets_.items() :
+        if name not in self.datasets_ :
+          merged = DataSet( name )
+          merged.min_        = dataset.min_
+          merged.max_        = dataset.max_
+          merged.lineColor_  = dataset.lineColor_
+          merged.pointColor_ = dataset.pointColor_
+          merged.interp_     = dataset.interp_
+          self.datasets_[ name ] = merged
+
+    times  = {}
+    values = {}
+    # Interpolation of the segment starting at every breakpoint, so each
+    # stage keeps its own. Holds are flat so any mode would do for them
+    modes  = {}
+    for name in self.datasets_.keys() :
+      times[ name ]  = []
+      values[ name ] = []
+      modes[ name ]  = []
+
+    start = 0.0
+    for sub, stage in stages :
+      offset = max( stage.get( "offset", 0 ), 0 )
+      if offset > 0 :
+        for name, merged in self.datasets_.items() :
+          times[ name ].append( [ start, start + offset ] )
+          values[ name ].append( [ merged.min_, merged.min_ ] )
+          modes[ name ] += [ Interpolation.LINEAR ] * 2
+        start += offset
+
+      timeScale = stage.get( "timeScale", 1.0 )
+      scale     = stage.get( "scale", {} )
+      duration  = sub.summary_.totalTime * timeScale
+
+      for repeat in range( 0, stage.get( "repeat", 1 ) ) :
+        for name, merged in self.datasets_.items() :
+          if name in sub.datasets_ and sub.datasets_[ name ].time_.shape[0] > 0 :
+            dataset = sub.datasets_[ name ]
+            value   = dataset.value_ * scale.get( name, 1.0 )
+            # Hold the ends across the whole stage, same as a lone profile would
+            times[ name ].append( np.concatenate( ( [ start ], start + dataset.time_ * timeScale, [ start + duration ] ) ) )
+            values[ name ].append( np.concatenate( ( [ value[0] ], value, [ value[-1] ] ) ) )
+            modes[ name ] += [ Interpolation.LINEAR ] + [ dataset.interp_ ] * ( value.shape[0] - 1 ) + [ Interpolation.LINEAR ] * 2
+          else :
+            times[ name ].append( [ start, start + duration ] )
+            values[ name ].append( [ merged.min_, merged.min_ ] )
+            modes[ name ] += [ Interpolation.LINEAR ] * 2
+        start += duration
+
+    for name, merged in self.datasets_.items() :
+      merged.time_  = np.concatenate( times[ name ] ).astype( float )
+      merged.value_ = np.concatenate( values[ name ] ).astype( float )
+      segments      = modes[ name ][:-1]
+      merged.runs_  = [ ( i, interp ) for i, interp in enumerate( segments ) if i == 0 or interp != segments[ i - 1 ] ]
+
+  def saveCompiled( self, filename, digest ) :
+    header = { "hash" : digest, "name" : self.name_, "datasets" : [], "totalTime" : self.summary_.totalTime, "channels" : {} }
+    for name, dataset in self.datasets_.items() :
+      header[ "datasets" ].append( {
+                                    "name"       : dataset.name_,
+                                    "min"        : dataset.min_,
+                                    "max"        : dataset.max_,
+                                    "lineColor"  : dataset.lineColor_,
+                                    "pointColor" : dataset.pointColor_,
+                                    "interp"     : dataset.interp_.value,
+                                    "runs"       : [ [ first, interp.value ] for first, interp in dataset.runs_ ],
+                                    "start"      : dataset.start_,
+                                    "count"      : dataset.count_
+                                    } )
+
+    for name, channel in self.summary_.channels.items() :
+      header[ "channels" ][ name ] = list( channel )
+
+    library.writeCompiled( filename, header, [ self.data_, self.times_ ] )
+
+  def loadCompiled( self, filename, digest ) :
+    compiled = library.readCompiled( filename, digest )
+    if compiled is None : return False
+    header, ( block, times ) = compiled
+
+    self.name_     = header[ "name" ]
+    self.datasets_ = {}
+    for meta in header[ "datasets" ] :
+      dataset = DataSet( meta[ "name" ] )
+      dataset.min_        = meta[ "min" ]
+      dataset.max_        = meta[ "max" ]
+      dataset.lineColor_  = meta[ "lineColor" ]
+      dataset.pointColor_ = meta[ "pointColor" ]
+      dataset.interp_     = Interpolation( meta[ "interp" ] )
+      dataset.runs_       = [ ( first, Interpolation( interp ) ) for first, interp in meta[ "runs" ] ]
+      dataset.start_      = meta[ "start" ]
+      dataset.count_      = meta[ "count" ]
+      self.datasets_[ dataset.name_ ] = dataset
+    # Views into the mapping
+    self.attach( block, times )
+
+    channels = {}
+    for name, channel in header[ "channels" ].items() :
+      channels[ name ] = ChannelSummary( *channel )
+    self.summary_ = ProfileSummary( header[ "totalTime" ], types.MappingProxyType( channels ) )
+    return True
+
+  def invalidate( self ) :
+    # Call whenever datasets are edited so cached lookups are rebuilt
+    for name, dataset in self.datasets_.items() :
+      # Compile from the values exactly as pack() stores them, else the
+      # segments no longer meet where the rounded breakpoints are
+      dataset.time_  = dataset.time_.astype( TIME_DTYPE )
+      dataset.value_ = dataset.value_.astype( PROFILE_DTYPE ).astype( float )
+      dataset.compile()
+    self.pack()
+    self.summary_ = self.summarize()
+
+  def summarize( self ) :
+    channels  = {}
+    totalTime = 0
+    for name, dataset in self.datasets_.items() :
+      if dataset.time_.shape[0] == 0 : continue
+      # Longest time
+      totalTime = max( totalTime, float( np.max( dataset.time_ ) ) )
+
+    for name, dataset in self.datasets_.items() :
+      if dataset.time_.shape[0] == 0 : continue
+
+      channels[ name ] = ChannelSummary(
+                                        float( np.min( dataset.value_ ) ),
+                                        float( np.max( dataset.value_ ) ),
+                                        float( dataset.time_[0] ),
+                                        float( dataset.time_[-1] ),
+                                        float( dataset.value_[0] ),
+                                        float( dataset.value_[-1] ),
+                                        # Over the whole run, e.g. total UV dose for lights
+                                        dataset.integralAt( totalTime )
+                                        )
+
+    return ProfileSummary( totalTime, types.MappingProxyType( channels ) )
+
+  def evaluate( self, times, names=None ) :
+    # Evaluate all datasets over a shared time grid in one pass
+    # Returns a ( channels x samples ) array with rows in the order of names,
+    # channels this profile does not have are filled with NaN
+    if names is None : names = CHANNELS
+    times = np.atleast_1d( np.asarray( times, dtype=float ) )
+
+    values = np.full( ( len( names ), times.shape[0] ), np.nan )
+    for row, name in enumerate( names ) :
+      if name in self.datasets_ and self.datasets_[ name ].time_.shape[0] > 0 :
+        values[ row ] = self.datasets_[ name ].evaluate( times )
+    return values
     
 class DataModel( object ) :
   def __init__( self ) :
@@ -67,10 +627,16 @@ class DataModel( object ) :
 
     # Current time into config in seconds
     self.currentTime_ = -1
+    self.clock_       = ProfileClock()
 
     self.currentData_ = { "zaxis" : 0, "fan" : 0, "lights" : 0 }
     self.currentTotalTime_ = 0
 
+    # UV dose actually commanded this run, integrated tick by tick
+    self.deliveredDose_  = 0.0
+    self.lastDoseTime_   = None
+    self.lastDoseValue_  = 0.0
+
     #######################
     # Data specific
     self.zaxisEnabled_ = True
@@ -82,26 +648,87 @@ class DataModel( object ) :
     # where to load from
     self.dataFolder_ = "configs/"
 
+    # Profiles are indexed at boot and only fully loaded when selected
+    self.index_   = None
+    self.library_ = library.ProfileCache()
+
   def loadFolder( self, folder=None ) :
     if folder is not None :
       self.dataFolder_ = folder
 
-    files = glob.glob( self.dataFolder_ + "/*.cfg" )
+    self.index_ = library.ProfileIndex( self.dataFolder_ )
+    self.index_.load()
+    self.index_.scan()
     
-    for cfg in files :
+    for filename, entry in self.index_.files() :
       cfgData = Configuration( "temp" )
-      cfgData.loadFile( cfg )
+      cfgData.loadIndex( filename, entry )
       self.configs_.append( cfgData )
 
     if self.currentConfigIdx_ is None and len( self.configs_ ) > 0 :
       self.currentConfigIdx_ = 0
 
+  def refreshFolder( self, busy=False ) :
+    # Pick up profiles added, edited or removed since the last scan
+    # Returns ( added, changed, removed ) configurations. While busy the
+    # current profile is left alone and picked up once we are idle again
+    if self.index_ is None : return [], [], []
+
+    current = self.getCurrentConfig() if busy else None
+    hold    = [ current.filename_ ] if current is not None else []
+    addedFiles, changedFiles, removedFiles = self.index_.scan( hold )
+
+    # Composites are stale when any stage they reference moved
+    touched = set( [ os.path.basename( filename ) for filename in addedFiles + changedFiles + removedFiles ] )
+    for filename, entry in self.index_.files() :
+      if filename in hold or filename in addedFiles or filename in changedFiles : continue
+      if len( touched.intersection( entry.get( "stages", [] ) ) ) > 0 :
+        changedFiles.append( filename )
+
+    byFilename = {}
+    for cfg in self.configs_ :
+      byFilename[ cfg.filename_ ] = cfg
+
+    added = []
+    for filename in addedFiles :
+      cfgData = Configuration( "temp" )
+      cfgData.loadIndex( filename, self.index_.entries_[ os.path.basename( filename ) ] )
+      self.configs_.append( cfgData )
+      added.append( cfgData )
+
+    changed = []
+    for filename in changedFiles :
+      if filename not in byFilename : continue
+      cfgData = byFilename[ filename ]
+      self.library_.discard( cfgData )
+      cfgData.unload()
+      cfgData.loadIndex( filename, self.index_.entries_[ os.path.basename( filename ) ] )
+      changed.append( cfgData )
+
+    removed = []
+    for filename in removedFiles :
+      if filename not in byFilename : continue
+      cfgData = byFilename[ filename ]
+      idx     = self.configs_.index( cfgData )
+      self.library_.discard( cfgData )
+      cfgData.unload()
+      self.configs_.pop( idx )
+      removed.append( cfgData )
+
+      # Keep pointing at the same profile
+      if idx < self.currentConfigIdx_ or self.currentConfigIdx_ >= len( self.configs_ ) :
+        self.currentConfigIdx_ = max( self.currentConfigIdx_ - 1, 0 )
+
+    if len( added ) + len( changed ) + len( removed ) > 0 :
+      print( "Profiles refreshed [ added : " + str( len( added ) ) + ", changed : " + str( len( changed ) ) + ", removed : " + str( len( removed ) ) + " ]" )
+    return added, changed, removed
+
   def getProfileNames( self ) :
     return [ cfg.name_ for cfg in self.configs_ ]
       
   def getCurrentConfig( self ) :
-    if self.currentConfigIdx_ >= 0 :
-      return self.configs_[ self.currentConfigIdx_ ]
+    if self.currentConfigIdx_ >= 0 and self.currentConfigIdx_ < len( self.configs_ ) :
+      return self.library_.acquire( self.configs_[ self.currentConfigIdx_ ] )
     else :
       return None
 
@@ -111,15 +738,63 @@ class DataModel( object ) :
       
       if currentConfig is None : return None
       
-      # Return longest time
-      totalTime = 0
-      for name, dataset in currentConfig.datasets_.items() :
-        totalTime = np.maximum( np.max( dataset.time_ ), totalTime )
-
-        self.currentTotalTime_ = totalTime
+      # Longest time, cached when the profile was loaded
+      self.currentTotalTime_ = currentConfig.summary_.totalTime
         
     return self.currentTotalTime_
 
+  def evaluate( self, times, names=None ) :
+    # Batched version of getCurrentData for previews and full run traces
+    currentConfig = self.getCurrentConfig()
+    if currentConfig is None : return None
+    return currentConfig.evaluate( times, names )
+
+  def writeOutputs( self, outputs ) :
+    # Push the current data to the outputs driving the hardware, anything
+    # with a settable .value will do
+    currentData = self.getCurrentData( )
+    if currentData is None : return None
+    for name, value in currentData.items() :      
+      if name == "fan" :
+        outputs[ name ].value = value
+      elif name == "lights" :
+        pass
+      elif name == "zaxis" :
+        pass
+
+    self.accumulateDose( self.currentTime_, currentData[ "lights" ] )
+    return currentData
+
+  def resetDose( self ) :
+    self.deliveredDose_ = 0.0
+    self.lastDoseTime_  = None
+    self.lastDoseValue_ = 0.0
+
+  def skipDose( self ) :
+    # Time is about to jump (seek, resume), do not count the gap as delivered
+    self.lastDoseTime_ = None
+
+  def accumulateDose( self, time, lights ) :
+    # Trapezoid between what we commanded last tick and now, jumps backwards
+    # (scrubbing) only move the reference point
+    if time < 0 : return
+    if self.lastDoseTime_ is not None and time > self.lastDoseTime_ :
+      self.deliveredDose_ += 0.5 * ( lights + self.lastDoseValue_ ) * ( time - self.lastDoseTime_ )
+    self.lastDoseTime_  = time
+    self.lastDoseValue_ = lights
+
+  def getDose( self ) :
+    # ( delivered, total, remaining ) UV dose for the current profile, total and
+    # remaining are from the profile itself so are only known in auto mode
+    currentConfig = self.getCurrentConfig()
+    if ( self.controlMode_ != ControlModes.AUTO_RUN or currentConfig is None or
+         "lights" not in currentConfig.summary_.channels ) :
+      return self.deliveredDose_, None, None
+
+    total     = currentConfig.summary_.channels[ "lights" ].integral
+    scheduled = currentConfig.datasets_[ "lights" ].integralAt( max( self.currentTime_, 0 ) )
+    return self.deliveredDose_, total, max( total - scheduled, 0.0 )
+
   def getCurrentData( self, data=None ) :
 
     if self.controlMode_ == ControlModes.AUTO_RUN :
@@ -129,20 +804,20 @@ class DataModel( object ) :
       
                 
       if data is None :
-        for name, dataset in currentConfig.datasets_.items() :
+        for name, dataset in currentConfig.channels_ :
           # Return interpolated data for current time in order of
           # { dataset : value }
           if   name == "zaxis" and not self.zaxisEnabled_ : continue
           elif name == "fan"   and not self.fanEnabled_   : continue
           elif name == "uvled" and not self.uvledEnabled_ : continue
           
-          self.currentData_[ name ] = np.interp( self.currentTime_, dataset.time_, dataset.value_ )
+          self.currentData_[ name ] = dataset.valueAt( self.currentTime_ )
           
       else :
         if ( ( data == "zaxis" and self.zaxisEnabled_ ) or
              ( data == "fan"   and self.fanEnabled_   ) or
              ( data == "uvled" and self.uvledEnabled_ ) ) :
-          self.currentData_[ data ] = np.interp( self.currentTime_, currentConfig.datasets_[ data ].time_, currentConfig.datasets_[ data ].value_ )
+          self.currentData_[ data ] = currentConfig.datasets_[ data ].valueAt( self.currentTime_ )
         
 
     if data is None :
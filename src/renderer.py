@@ -1,33 +1,58 @@
+import hashlib
 import multitimer
 import numpy as np
 import threading
-from PIL import ImageFont, ImageColor, Image
-import luma.core.sprite_system as luma_sprite
-import luma.core.render as luma_render
-
+import time
+from PIL import ImageFont, ImageColor, Image, ImageDraw
+import governor
 import hardware
+import history
+import metrics
 import model
 import widgets
 
 class Renderer( object ) :
-  def __init__( self, ctrl, model ) :
+  def __init__( self, ctrl, model, historyFolder="history", frameRates=None ) :
     self.hwctrl_ = ctrl
     self.model_  = model
     self.updateHz_ = 30
     self.runningTimer_ = False
-    self.manualTimeAdjust_ = 2.5 # To dial in actual time stepping, this isn't fancy ok it barely works
-    # We are going to make it think it's running 2x faster, as it is slow af
-    self.timer_ = multitimer.MultiTimer( interval=1.0/self.updateHz_, function=self.runTimer, kwargs={ 'interval' : self.manualTimeAdjust_/self.updateHz_ }, runonstart=True )
-    self.frameReg_ = luma_sprite.framerate_regulator( fps=self.updateHz_ )
+    # Started and not stopped yet, paused runs included
+    self.runStarted_   = False
+    # Profile time comes from the model clock, the tick rate only sets how
+    # often we sample it so late ticks simply land further along the profile
+    self.timer_ = multitimer.MultiTimer( interval=1.0/self.updateHz_, function=self.runTimer, runonstart=True )
+    self.recorder_ = history.RunRecorder( historyFolder )
+    # Where every frame's time goes, see metrics.STAGES
+    self.metrics_  = metrics.FrameMetrics()
+    # Display rate follows activity, see governor.DEFAULT_RATES
+    self.governor_ = governor.FrameGovernor( frameRates, running=lambda : self.runningTimer_ )
     self.font_   = ImageFont.truetype( "/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf", size=8 )
     self.smallfont_   = ImageFont.truetype( "/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf", size=7 )
 
-    self.lock_ = threading.Lock()
+    # Guards widget and model state, held while composing a frame but never
+    # while the display is written
+    self.lock_ = threading.RLock()
+    # Keeps frames reaching the display in the order they were composed
+    self.displayLock_ = threading.Lock()
 
-    self.baseCanvas_ = None
+    # Whole frame drawn in memory, only what changed is sent to the display
+    self.frame_      = None
     self.setupImg_   = Image.open( "resources/setup.png" )
     self.buildImg_   = Image.open( "resources/build_plate_trans.png" )
     self.buildPlateYPos_ = 55
+    self.drawnBuildPlateYPos_ = None
+    # Setup art with the build plate at every height it has been drawn at,
+    # flattened over the background as ( opaque image, box, holes )
+    self.sprites_           = {}
+    self.spritesBackground_ = None
+    # Data widgets seen through the holes in the setup art
+    self.spriteFills_       = [ "UV", "Fan" ]
+    self.drawnContext_        = None
+    # Digest of what is on the display, identical frames are not sent again
+    self.drawnDigest_         = None
+    self.framesSent_          = 0
+    self.framesSkipped_       = 0
 
     for key, value in self.hwctrl_.buttons_.items() :
       value.when_pressed = self.buttonPress
@@ -44,7 +69,7 @@ class Renderer( object ) :
     #self.mainWidgets_.addWidget( "Settings",         widgets.TextBox( "Settings", "darkgreen", 1, 5,  0,  0, 43, 16, self.font_, 1 ) )
     #self.mainWidgets_.addWidget( "Hardware",         widgets.TextBox( "Hardware", "darkgreen", 1, 5, 44,  0, 43, 16, self.font_, 1 ) )
     #self.mainWidgets_.addWidget( "Help",             widgets.TextBox( "Help",     "darkgreen", 10, 5, 88,  0, 40, 16, self.font_, 1 ) )
-    self.mainWidgets_.addWidget( "ConfigsBar",       widgets.TextBox( "No\nConfigs\nLoaded", "darkgreen", 2, 5, 0, 0, 43, 128, self.font_, 2 ) )
+    self.mainWidgets_.addWidget( "ConfigsBar",       widgets.TextBox( "No\nConfigs\nLoaded", "darkgreen", 2, 5, 0, 0, 43, 110, self.font_, 2 ) )
     self.mainWidgets_.addWidget( "Resolution",       widgets.TextBox( "Interval " + str( self.model_.timeResolution_ ) + " sec", "darkgreen", 2, 2, 44, 0, 84, 17, self.font_, 1, spacing=2 ), canSelect=False )
     self.mainWidgets_.addWidget( "TimeAdjustUp",     widgets.TextBox( "^UP",   "lightblue", 2, 1, 129,  0, 30, 8, self.font_, 1, spacing=2 ), takeImmediateInput=True )
     self.mainWidgets_.addWidget( "TimeAdjustDown",   widgets.TextBox( "vDOWN", "tomato",    2, 1, 129,   9, 30, 8, self.font_, 1, spacing=2 ), takeImmediateInput=True )
@@ -56,6 +81,7 @@ class Renderer( object ) :
     self.dataWidgets_.addWidget( "Data_fan",         widgets.TextBox( "NO DATA", "blue", 3, 1, 102, 18, 58, 12, self.font_, 0, spacing=0 ), canSelect=False )
     self.dataWidgets_.addWidget( "Data_lights",      widgets.TextBox( "NO DATA", "blue", 0, 1,  44, 31, 58, 12, self.font_, 0, spacing=0 ), canSelect=False )
     self.dataWidgets_.addWidget( "Data_time",        widgets.TextBox( "NO DATA", "blue", 3, 1, 102, 31, 58, 12, self.font_, 0, spacing=0 ), canSelect=False )
+    self.dataWidgets_.addWidget( "Data_dose",        widgets.TextBox( "NO DATA", "magenta", 2, 1, 0, 111, 43, 17, self.smallfont_, 0, spacing=0 ), canSelect=False )
     self.dataWidgets_.addWidget( "UV",               widgets.TextBox( "", "blue", 2, -1, 132, 113, 22, 9, self.smallfont_, 0 ), canSelect=False )
     self.dataWidgets_.addWidget( "Fan",              widgets.TextBox( "", "blue", 2, -1, 131, 105, 24, 3, self.smallfont_, 0 ), canSelect=False )
 
@@ -80,100 +106,154 @@ class Renderer( object ) :
 
     self.maxConfigsOnScreen_ = 4
     self.configHeight_       = 17
+    self.configCount_        = 0
+    self.configWidgetNames_  = {}
     for cfg in self.model_.configs_ :
       self.addConfig( cfg )
     self.checkLeaveConfigs( "noop" )
     
     for name, widget in self.mainWidgets_.widgets_.items() :
-      widget.name_ = name
-      widget.fg_ = "green"
-      widget.bg_ = ImageColor.getrgb( "#1f0f0f" )
-      widget.selectFg_       = "white"
-      widget.selectBg_       = "black"
-      
-      widget.focusFg_       = "orange"
-      widget.focusBg_       = "black"
-      widget.deselect()
-
-    for name, widget in self.configWidgets_.widgets_.items() :
-      widget.name_ = name
-      widget.fg_ = "green"
-      widget.bg_ = ImageColor.getrgb( "#1f0f0f" )
-      widget.selectFg_       = "white"
-      widget.selectBg_       = "black"
-      
-      widget.focusFg_       = "orange"
-      widget.focusBg_       = "black"
-      widget.deselect()
+      self.styleWidget( name, widget )
       
     self.quit_ = False
 
+    # Watch the config folder for profiles being added, edited or removed
+    self.folderScanInterval_ = 2.0
+    self.folderTimer_ = multitimer.MultiTimer( interval=self.folderScanInterval_, function=self.handleFolderChanges, runonstart=False )
+    self.folderTimer_.start()
+
     self.currentContext_ = "main"
     
     self.contexts_ = {}
     self.contexts_[ "main" ]       = [ self.main, self.mainWidgets_ ]
 
-  def runTimer( self, interval=1.0 ) :
-    if not self.runningTimer_ : return
+    # Widgets that only change on input, rasterized once and copied under
+    # every frame until one of them looks different
+    self.backgrounds_ = {}
+    self.backgrounds_[ "main" ]    = widgets.Layer( [ self.mainWidgets_, self.configWidgets_ ] )
+
+    # Frames are drawn on their own thread, everyone else only asks for one
+    # so a slow display never holds up a control tick or a button press
+    self.renderCondition_ = threading.Condition()
+    self.renderRequested_ = False
+    self.renderThread_    = threading.Thread( target=self.renderLoop, name="render", daemon=True )
+    self.renderThread_.start()
+
+  def runTimer( self ) :
+    self.lock_.acquire()
+    try :
+      # A tick that waited on the lock while we were stopped
+      if not self.runningTimer_ : return
+      self.model_.currentTime_ = self.model_.clock_.now()
         
-    if self.model_.currentTime_ > self.model_.getCurrentTotalTime() :
-      # Stop yourself before you wreck yourself
-      print( "Profile finished... Stopping [ total profile time : " + str( self.model_.getCurrentTotalTime() ) + "]" )
-      self.handleStopTimer()
-
-    #print( "Current time is : " + str( self.model_.currentTime_ ) + " seconds" )
-    # Write data to hw controller
-    currentData   = self.model_.getCurrentData( )
-                   
-    for name, value in currentData.items() :      
-      if name == "fan" :
-        self.hwctrl_.outputs_[ name ].value = value
-      elif name == "lights" :
-        pass
-      elif name == "zaxis" :
-        pass
+      totalTime = self.model_.getCurrentTotalTime()
+      if totalTime is None :
+        # Profile went away underneath us
+        print( "Profile unavailable... Stopping" )
+        self.handleStopTimer()
+        return
+      if self.model_.currentTime_ > totalTime :
+        # Stop yourself before you wreck yourself
+        print( "Profile finished... Stopping [ total profile time : " + str( totalTime ) + "]" )
+        self.handleStopTimer()
+
+      #print( "Current time is : " + str( self.model_.currentTime_ ) + " seconds" )
+      # Write data to hw controller
+      currentData = self.model_.writeOutputs( self.hwctrl_.outputs_ )
+      self.recorder_.record( time.time(), self.model_.currentTime_, currentData, self.model_.controlMode_ )
+    finally :
+      self.lock_.release()
     
-    self.render()
-    self.model_.currentTime_ += interval
+    self.requestRender()
     
 
   def main( self, canvas ) :
+    mark = time.perf_counter()
 
     # Time at which to handle
     self.handleDataCursor( self.model_.currentTime_ )
+
+    # Anything that changes the traces or cursor drawn over the graph
+    currentConfig = self.model_.getCurrentConfig()
+    self.mainWidgets_.widgets_[ "PreviewGraph" ].content_ = ( 
+                                                             id( currentConfig ) if currentConfig is not None else None,
+                                                             id( currentConfig.data_ ) if currentConfig is not None else None,
+                                                             self.model_.timeResolution_,
+                                                             self.dataCursorPix_
+                                                             )
     
-    for name, widgets in self.mainWidgets_.widgets_.items() :
-      widgets.draw( canvas )
-    for name, cfg in self.configWidgets_.widgets_.items() :
-      cfg.draw( canvas )
+    # Main and config widgets are already in the background layer
     for name, data in self.dataWidgets_.widgets_.items() :
       data.draw( canvas )
+    mark = self.metrics_.lap( "widgets", mark )
+
+    self.mainWidgets_.widgets_[ "PreviewGraph" ].beginData()
       
-    if self.model_.getCurrentConfig() is not None:
-      # print( "Previewing config : " + self.model_.getCurrentConfig().name_ )
+    if currentConfig is not None:
+      # print( "Previewing config : " + currentConfig.name_ )
            
-      for name, dataset in self.model_.getCurrentConfig().datasets_.items() :
-        data = np.array( ( dataset.time_,
-                           dataset.value_ ) )
+      # Seconds per pixel column at the current zoom
+      secPerPixX = ( self.model_.timeResolution_ / self.valueSubdivisions_ ) / self.mainWidgets_.widgets_[ "PreviewGraph" ].gridPxIncx_
+      traces = []
+      for name, dataset in currentConfig.datasets_.items() :
         incy = ( dataset.max_ - dataset.min_ ) / self.valueSubdivisions_
-        
-        self.mainWidgets_.widgets_[ "PreviewGraph" ].drawData(
-                                                              data,
-                                                              self.model_.timeResolution_ / self.valueSubdivisions_,
-                                                              incy,
-                                                              dataset.lineColor_,
-                                                              dataset.pointColor_
-                                                              )
-        if self.dataCursorPix_ >= 0 :
-          x  = self.dataCursorPix_ + self.mainWidgets_.widgets_[ "PreviewGraph" ].x_ + self.mainWidgets_.widgets_[ "PreviewGraph" ].borderpx_ + 1
-          y1 = self.mainWidgets_.widgets_[ "PreviewGraph" ].y_ + self.mainWidgets_.widgets_[ "PreviewGraph" ].borderpx_
-          y2 = y1 + self.mainWidgets_.widgets_[ "PreviewGraph" ].height_ - self.mainWidgets_.widgets_[ "PreviewGraph" ].borderpx_
-          canvas.line( [ x, y1, x, y2 ], self.dataCursorColor_ )
+        # Only linear data is drawn straight through its breakpoints
+        linear = all( [ interp == model.Interpolation.LINEAR for first, end, interp in dataset.runs() ] )
+        marks  = None if linear else ( dataset.time_, dataset.value_ )
+        traces.append( ( dataset.decimated( secPerPixX ), self.model_.timeResolution_ / self.valueSubdivisions_, incy, dataset.lineColor_, dataset.pointColor_, marks ) )
+
+      # Scrolling reuses what was already drawn until the profile or zoom changes
+      self.mainWidgets_.widgets_[ "PreviewGraph" ].drawTraces( self.frame_, traces, ( id( currentConfig ), id( currentConfig.data_ ) ) )
+
+      if self.dataCursorPix_ >= 0 :
+        x  = self.dataCursorPix_ + self.mainWidgets_.widgets_[ "PreviewGraph" ].x_ + self.mainWidgets_.widgets_[ "PreviewGraph" ].borderpx_ + 1
+        y1 = self.mainWidgets_.widgets_[ "PreviewGraph" ].y_ + self.mainWidgets_.widgets_[ "PreviewGraph" ].borderpx_
+        y2 = y1 + self.mainWidgets_.widgets_[ "PreviewGraph" ].height_ - self.mainWidgets_.widgets_[ "PreviewGraph" ].borderpx_
+        canvas.line( [ x, y1, x, y2 ], self.dataCursorColor_ )
+    mark = self.metrics_.lap( "graph", mark )
 
     # Draw fancy
-    # Now paste the setup 
-    self.baseCanvas_.image.paste( self.setupImg_, ( 128, 44 ), mask=self.setupImg_ )
-    self.baseCanvas_.image.paste( self.buildImg_, ( 128, self.buildPlateYPos_ ), mask=self.buildImg_ )
+    # Now paste the setup, already blended so only the holes need filling
+    box   = ( 128, 44, 128 + self.setupImg_.width, 44 + self.setupImg_.height )
+    plate = ( 128, self.buildPlateYPos_, 128 + self.buildImg_.width, self.buildPlateYPos_ + self.buildImg_.height )
+    fills = []
+    for name in self.spriteFills_ :
+      widget = self.dataWidgets_.widgets_[ name ]
+      if widget.hidden_ : continue
+      area = widget.bounds()
+      area = ( max( area[0], box[0] ), max( area[1], box[1] ), min( area[2], box[2] ), min( area[3], box[3] ) )
+      if area[0] < area[2] and area[1] < area[3] :
+        fills.append( ( widget.currentBg_, area ) )
+
+    if plate[1] < box[1] or plate[3] > box[3] or any( [ area[1] < plate[3] and plate[1] < area[3] for color, area in fills ] ) :
+      # Plate driven off its range, out of the art or over a widget
+      self.frame_.paste( self.setupImg_, box[:2], mask=self.setupImg_ )
+      self.frame_.paste( self.buildImg_, plate[:2], mask=self.buildImg_ )
+    else :
+      image, holes = self.sprite( self.backgrounds_[ "main" ].image_, box )
+      self.frame_.paste( image, box[:2] )
+      for color, area in fills :
+        self.frame_.paste( color, area, mask=holes.crop( ( area[0] - box[0], area[1] - box[1], area[2] - box[0], area[3] - box[1] ) ) )
+    self.metrics_.lap( "sprites", mark )
+
+  def sprite( self, background, box ) :
+    # ( image, holes ) of the setup art in box with the build plate at
+    # buildPlateYPos_ blended over background, holes marks where the data
+    # widgets under them show through
+    if background is not self.spritesBackground_ :
+      self.sprites_           = {}
+      self.spritesBackground_ = background
+
+    y = self.buildPlateYPos_
+    if y not in self.sprites_ :
+      image   = background.crop( box )
+      covered = Image.new( "L", image.size )
+      for sprite, top in [ ( self.setupImg_, box[1] ), ( self.buildImg_, y ) ] :
+        image.paste( sprite, ( 0, top - box[1] ), mask=sprite )
+        covered.paste( 255, ( 0, top - box[1] ), mask=sprite )
+      holes = covered.point( lambda value : 255 if value == 0 else 0, "1" )
+      self.sprites_[ y ] = ( image, holes )
+    return self.sprites_[ y ]
 
   def settings( self, canvas ) :
     pass
@@ -186,7 +266,7 @@ class Renderer( object ) :
 
 
   def handleDataCursor( self, time ) :
-    if self.baseCanvas_ is not None :
+    if self.frame_ is not None :
       
       if time < 0 :  
         self.buildPlateYPos_ = 55
@@ -213,8 +293,16 @@ class Renderer( object ) :
         # Gather data at time
         currentData   = self.model_.getCurrentData( )
         currentConfig = self.model_.getCurrentConfig( )
+        if currentConfig is None : return
         
         self.dataWidgets_.widgets_[ "Data_time" ].text_ = "Time " + "{:3.2f}".format( self.model_.currentTime_ ) + " sec"
+
+        # UV dose delivered this run, and what the profile still has to give
+        # when we know it
+        delivered, totalDose, remainingDose = self.model_.getDose()
+        self.dataWidgets_.widgets_[ "Data_dose" ].text_ = "UV   {:.1f}".format( delivered )
+        if remainingDose is not None :
+          self.dataWidgets_.widgets_[ "Data_dose" ].text_ += "\nleft {:.1f}".format( remainingDose )
         
         for name, value in currentData.items() :
           # This is very dependent on the data widgets being there, I don't like it but I'm so tired at this point
@@ -247,6 +335,8 @@ class Renderer( object ) :
     elif direction == "right" :
       self.model_.currentTime_ += self.model_.timeResolution_ / self.valueSubdivisions_ / 8
       # self.mainWidgets_.widgets_[ "PreviewGraph" ].moveRight()
+    self.model_.clock_.seek( self.model_.currentTime_ )
+    self.model_.skipDose()
 
   def checkLeaveGraph( self, direction ) :
     leaveGraph = ( direction == "press" ) or ( direction == "up" )
@@ -254,18 +344,17 @@ class Renderer( object ) :
       self.mainWidgets_.widgets_[ "PreviewGraph" ].drawPosX_ = 0
       self.mainWidgets_.widgets_[ "PreviewGraph" ].drawPosY_ = 0
       self.model_.currentTime_ = -1
+      self.model_.clock_.seek( self.model_.currentTime_ )
+      self.model_.skipDose()
       self.dataCursorPix_      = -1
     return leaveGraph
     
   def handleConfigs( self, direction ) :
     currentIdx = self.configWidgets_.getCurrentWidgetIndex( )
 
-    # We are actively running a profile and are changing, abort
-    if self.runningTimer_ or self.model_.currentTime_ != 0 :
-      if self.model_.currentConfigIdx_ != currentIdx :
-        self.handleStartPauseTimer( )
-        # This does extra and resets values
-        self.handleStopTimer( )
+    # We are running a profile (or paused one) and are changing, abort
+    if self.runStarted_ and self.model_.currentConfigIdx_ != currentIdx :
+      self.handleStopTimer( )
         
     self.model_.currentConfigIdx_ = currentIdx
     
@@ -293,6 +382,17 @@ class Renderer( object ) :
                )
              )
     
+  def styleWidget( self, name, widget ) :
+    widget.name_ = name
+    widget.fg_ = "green"
+    widget.bg_ = ImageColor.getrgb( "#1f0f0f" )
+    widget.selectFg_       = "white"
+    widget.selectBg_       = "black"
+    
+    widget.focusFg_       = "orange"
+    widget.focusBg_       = "black"
+    widget.deselect()
+
   def addConfig( self, config ) :
     # We have at least one config now
     self.mainWidgets_.widgets_[ "ConfigsBar" ].text_ = ""
@@ -311,10 +411,59 @@ class Renderer( object ) :
                                 self.font_, 1
                                 )
     
-    name = config.name_ + " - " + str( len( self.configWidgets_.widgetsList_ ) )
+    name = config.name_ + " - " + str( self.configCount_ )
+    self.configCount_ += 1
     cfgWidget.addInput( self.handleStartPauseTimer )
     print( "Adding config widget : " + name ) 
     self.configWidgets_.addWidget( name, cfgWidget, takeImmediateInput=True )
+    self.configWidgetNames_[ config ] = name
+    self.styleWidget( name, cfgWidget )
+
+  def removeConfig( self, config ) :
+    name = self.configWidgetNames_.pop( config )
+    print( "Removing config widget : " + name )
+    self.configWidgets_.removeWidget( name )
+
+    if len( self.configWidgets_.widgetsList_ ) == 0 :
+      self.mainWidgets_.widgets_[ "ConfigsBar" ].text_ = "No\nConfigs\nLoaded"
+
+  def renameConfig( self, config ) :
+    name = self.configWidgetNames_[ config ]
+    self.configWidgets_.widgets_[ name ].text_ = ( config.name_[:6] + '..') if len(config.name_) > 8 else config.name_
+
+  def layoutConfigs( self ) :
+    # Stack the config widgets again after some were added or removed,
+    # scrolled so the current one is on screen
+    currentIdx = self.model_.currentConfigIdx_
+    scroll     = max( 0, currentIdx - self.maxConfigsOnScreen_ )
+    for i in range( 0, len( self.configWidgets_.widgetsList_ ) ) :
+      self.configWidgets_.widgetsList_[i].setY( self.mainWidgets_.widgets_[ "ConfigsBar" ].y_ + 1 + ( i - scroll ) * ( self.configHeight_ + 1 ) )
+      if ( ( self.configWidgets_.widgetsList_[i].centerY_ < self.mainWidgets_.widgets_[ "ConfigsBar" ].y_ ) or
+           ( self.configWidgets_.widgetsList_[i].centerY_ > ( self.mainWidgets_.widgets_[ "ConfigsBar" ].y_ + self.mainWidgets_.widgets_[ "ConfigsBar" ].height_ ) ) ) :
+        self.configWidgets_.widgetsList_[i].hide()
+      else :
+        self.configWidgets_.widgetsList_[i].unhide()
+
+  def handleFolderChanges( self ) :
+    added, changed, removed = [], [], []
+    self.lock_.acquire()
+    try :
+      # A started profile keeps going even while paused, its file is picked up once we stop
+      added, changed, removed = self.model_.refreshFolder( busy=self.runStarted_ )
+
+      for cfg in removed :
+        self.removeConfig( cfg )
+      for cfg in changed :
+        self.renameConfig( cfg )
+      for cfg in added :
+        self.addConfig( cfg )
+      if len( removed ) > 0 :
+        self.layoutConfigs()
+    finally :
+      self.lock_.release()
+
+    if len( added ) + len( changed ) + len( removed ) > 0 :
+      self.requestRender()
 
   def handleResAdjustUp( self, direction ) :
     if direction == "press" :
@@ -327,30 +476,54 @@ class Renderer( object ) :
       self.mainWidgets_.widgets_[ "Resolution" ].text_ = "Interval " + str( self.model_.timeResolution_ ) + " sec"
 
   def handleStartPauseTimer( self ) :
-    if self.runningTimer_ :
-      self.timer_.stop()
-      self.runningTimer_ = False
-      print( "Pausing profile" )
-    else :
-      if self.model_.getCurrentConfig() is not None :
-        self.timer_.start()
-        self.runningTimer_ = True
-        # Our first time in here
-        if self.model_.currentTime_ == -1 :
-          self.model_.currentTime_ = 0
-          self.model_.getCurrentTotalTime()
+    # Buttons, the timer and Blynk all end up here, same for stopping
+    self.lock_.acquire()
+    try :
+      if self.runningTimer_ :
+        self.timer_.stop()
+        self.runningTimer_ = False
+        self.model_.currentTime_ = self.model_.clock_.pause()
+        self.recorder_.flush()
+        print( "Pausing profile" )
+      else :
+        if self.model_.getCurrentConfig() is not None :
+          # Our first time in here
+          if self.model_.currentTime_ == -1 :
+            self.model_.currentTime_ = 0
+            self.model_.getCurrentTotalTime()
+
+          # New run, even when scrubbed somewhere before starting
+          if not self.runStarted_ :
+            self.runStarted_ = True
+            self.recorder_.start( self.model_.getCurrentConfig().name_, self.model_.controlMode_ )
+            self.model_.resetDose()
+
+          # Pick up from wherever we were paused or scrubbed to
+          self.model_.clock_.resume( self.model_.currentTime_ )
+          self.model_.skipDose()
+          self.timer_.start()
+          self.runningTimer_ = True
         
-        print( "Starting profile" )
+          print( "Starting profile" )
+    finally :
+      self.lock_.release()
 
   def handleStopTimer( self ) :
+    self.lock_.acquire()
     try :
-      self.timer_.stop()
-      print( "Stopping profile" )
-    except:
-      pass
-    self.runningTimer_ = False
-    self.model_.currentTime_ = -1
-    self.mainWidgets_.widgets_[ "PreviewGraph" ].drawPosX_ = 0
+      try :
+        self.timer_.stop()
+        print( "Stopping profile" )
+      except:
+        pass
+      self.runningTimer_ = False
+      self.runStarted_   = False
+      self.model_.clock_.pause()
+      self.recorder_.stop()
+      self.model_.currentTime_ = -1
+      self.mainWidgets_.widgets_[ "PreviewGraph" ].drawPosX_ = 0
+    finally :
+      self.lock_.release()
     
   def buttonPress( self, button ) :
 
@@ -360,21 +533,104 @@ class Renderer( object ) :
       print( "Hardware is manual mode, user cannot select" )
     else :
       # Get the current context widget manager
-      self.contexts_[ self.currentContext_ ][1].onInput( pressType )
-      self.render()
+      self.lock_.acquire()
+      try :
+        self.contexts_[ self.currentContext_ ][1].onInput( pressType )
+      finally :
+        self.lock_.release()
+      self.governor_.interact()
+      self.requestRender()
     
 
   def quit( self ) :
     return self.quit_
+
+  def damage( self ) :
+    # Boxes of the frame that changed since the last one, as reported by the
+    # widgets plus the sprites we paste on top of them
+    boxes = []
+    for manager in ( self.mainWidgets_, self.configWidgets_, self.dataWidgets_ ) :
+      boxes += manager.collectDamage()
+
+    if self.buildPlateYPos_ != self.drawnBuildPlateYPos_ :
+      plates = [ ( 128, y, 128 + self.buildImg_.width, y + self.buildImg_.height ) for y in ( self.buildPlateYPos_, self.drawnBuildPlateYPos_ ) if y is not None ]
+      boxes.append( widgets.unionBoxes( [ ( 128, 44, 128 + self.setupImg_.width, 44 + self.setupImg_.height ) ] + plates ) )
+      self.drawnBuildPlateYPos_ = self.buildPlateYPos_
+
+    return widgets.mergeBoxes( boxes )
+
+  def frameStats( self ) :
+    return { "sent" : self.framesSent_, "skipped" : self.framesSkipped_ }
+
+  def transmit( self, frame, boxes, context ) :
+    # Send the frame, only the damaged boxes if the display lets us and
+    # nothing at all if it is exactly what the display already shows
+    mark   = time.perf_counter()
+    digest = hashlib.blake2b( frame.tobytes(), digest_size=16 ).digest()
+    mark   = self.metrics_.lap( "digest", mark )
+    if digest == self.drawnDigest_ and context == self.drawnContext_ :
+      self.framesSkipped_ += 1
+      return
+    self.drawnDigest_ = digest
+    self.framesSent_ += 1
+
+    framebuffer = getattr( self.hwctrl_.device_, "framebuffer", None )
+    if isinstance( framebuffer, hardware.DamageFramebuffer ) :
+      if context != self.drawnContext_ :
+        # Nothing on screen is from this context
+        framebuffer.invalidate()
+      framebuffer.damage( boxes )
+    self.drawnContext_ = context
+    self.hwctrl_.device_.display( frame )
+
+    spent = time.perf_counter() - mark
+    if isinstance( framebuffer, hardware.DamageFramebuffer ) :
+      self.metrics_.record( "spi", framebuffer.writeTime_ )
+      spent -= framebuffer.writeTime_
+    self.metrics_.record( "convert", spent )
+
+  def requestRender( self ) :
+    # Ask for a frame of the newest state, any number of requests made before
+    # the render thread gets to it become one frame
+    with self.renderCondition_ :
+      self.renderRequested_ = True
+      self.renderCondition_.notify()
+    self.governor_.request()
+
+  def renderLoop( self ) :
+    while not self.quit_ :
+      with self.renderCondition_ :
+        while not self.renderRequested_ and not self.quit_ :
+          self.renderCondition_.wait()
+        self.renderRequested_ = False
+
+      # Caps our rate, requests made while we wait pile up into one
+      with self.governor_ :
+        self.render()
       
   def render( self ) :
-    self.lock_.acquire()
-    
-    with self.frameReg_ :
-      self.baseCanvas_ = luma_render.canvas( self.hwctrl_.device_, dither=True )
-      with  self.baseCanvas_ as canvas :
+    # Draw the newest state and send it, only composing holds the state lock
+    self.displayLock_.acquire()
+    try :
+      start = time.perf_counter()
+      self.lock_.acquire()
+      try :
+        mark = time.perf_counter()
+        self.frame_ = self.backgrounds_[ self.currentContext_ ].image( self.hwctrl_.device_.mode, self.hwctrl_.device_.size ).copy()
+        mark   = self.metrics_.lap( "background", mark )
+        canvas = ImageDraw.Draw( self.frame_ )
         self.contexts_[ self.currentContext_ ][0]( canvas )
         #if self.contexts_[ self.currentContext_ ][1].currentWidget_ is not None :
           # print( "Active Widget is : " + self.contexts_[ self.currentContext_ ][1].currentWidget_.name_ )
-
-    self.lock_.release()
+        mark    = time.perf_counter()
+        frame   = self.frame_
+        boxes   = self.damage()
+        context = self.currentContext_
+        self.metrics_.lap( "damage", mark )
+      finally :
+        self.lock_.release()
+
+      self.transmit( frame, boxes, context )
+      self.metrics_.record( "frame", time.perf_counter() - start )
+    finally :
+      self.displayLock_.release()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+from collections import namedtuple
+import sys
+import time
+
+import numpy as np
+
+import model
+
+# Complete trace of one simulated run
+#   times     : profile time of every tick
+#   commanded : { dataset : values } as returned by DataModel.getCurrentData
+#   outputs   : { output : values } as written to the hardware outputs
+#   events    : [ ( time, name ) ] for "half", "done" and "finished"
+SimulationResult = namedtuple( "SimulationResult", [ "name", "times", "commanded", "outputs", "events", "ticks", "elapsed" ] )
+
+class RecordedOutput( object ) :
+  """Stands in for a gpiozero output device, remembers the last value written"""
+  def __init__( self ) :
+    self.value = 0
+
+
+class Simulator( object ) :
+  """Runs a profile through the DataModel and output path as fast as the CPU allows"""
+  def __init__( self, dataModel, updateHz=30 ) :
+    self.model_    = dataModel
+    self.updateHz_ = updateHz
+    self.outputs_  = { "fan" : RecordedOutput() }
+
+  def run( self, configIdx=None ) :
+    if configIdx is not None :
+      self.model_.currentConfigIdx_ = configIdx
+
+    currentConfig = self.model_.getCurrentConfig()
+    if currentConfig is None : return None
+
+    self.model_.controlMode_ = model.ControlModes.AUTO_RUN
+    self.model_.currentTime_ = 0
+    self.model_.resetDose()
+    totalTime = self.model_.getCurrentTotalTime()
+    interval  = 1.0 / self.updateHz_
+
+    # One tick past the end is what stops the timer
+    count     = int( np.ceil( totalTime * self.updateHz_ ) ) + 2
+    times     = np.zeros( count )
+    commanded = {}
+    outputs   = {}
+    for name in currentConfig.datasets_.keys() :
+      commanded[ name ] = np.zeros( count )
+    for name in self.outputs_.keys() :
+      outputs[ name ] = np.zeros( count )
+
+    events = []
+    halfNotified = False
+    fullNotified = False
+
+    start = time.perf_counter()
+    tick  = 0
+    while tick < count :
+      currentTime = self.model_.currentTime_
+
+      # Same checks as Renderer.runTimer and BlynkInterface.periodicUpdates
+      if currentTime > totalTime :
+        events.append( ( currentTime, "finished" ) )
+        break
+      if not halfNotified and currentTime >= totalTime / 2 :
+        events.append( ( currentTime, "half" ) )
+        halfNotified = True
+      if not fullNotified and ( totalTime - currentTime ) < 1.0 :
+        events.append( ( currentTime, "done" ) )
+        fullNotified = True
+
+      currentData = self.model_.writeOutputs( self.outputs_ )
+
+      times[ tick ] = currentTime
+      for name in commanded.keys() :
+        commanded[ name ][ tick ] = currentData[ name ]
+      for name in outputs.keys() :
+        outputs[ name ][ tick ] = self.outputs_[ name ].value
+
+      self.model_.currentTime_ += interval
+      tick += 1
+
+    elapsed = time.perf_counter() - start
+    self.model_.currentTime_ = -1
+
+    for name in commanded.keys() :
+      commanded[ name ] = commanded[ name ][:tick]
+    for name in outputs.keys() :
+      outputs[ name ] = outputs[ name ][:tick]
+
+    return SimulationResult( currentConfig.name_, times[:tick], commanded, outputs, events, tick, elapsed )
+
+
+if __name__ == '__main__':
+  # Run every profile in a folder and report throughput plus how far the
+  # control path strays from a straight batched evaluation of the profile
+  dataModel = model.DataModel( )
+  dataModel.loadFolder( sys.argv[1] if len( sys.argv ) > 1 else "config" )
+  simulator = Simulator( dataModel )
+
+  for idx in range( 0, len( dataModel.configs_ ) ) :
+    result    = simulator.run( idx )
+    reference = dataModel.evaluate( result.times, list( result.commanded.keys() ) )
+    error     = max( [ np.max( np.abs( result.commanded[ name ] - reference[ row ] ) ) for row, name in enumerate( result.commanded.keys() ) ] + [ 0 ] )
+
+    print( "{0} : {1} ticks in {2:.3f} sec [ {3:.0f} ticks/sec ], max error {4:.3g}".format( result.name, result.ticks, result.elapsed, result.ticks / max( result.elapsed, 1e-9 ), error ) )
+    for eventTime, name in result.events :
+      print( "  {0: <8} at {1:.2f} sec".format( name, eventTime ) )
@@ -0,0 +1,107 @@
+import atexit
+import json
+import os
+import time
+
+import hardware
+import model
+import renderer
+
+# Everything a single station needs, a station's entry in the stations file
+# only needs what differs
+DEFAULT_STATION = {
+                   "name"     : "station",
+                   # Profiles and run recordings, give each station its own
+                   "config"   : "config",
+                   "history"  : "history",
+                   # { "secrets" : file with the auth token, "server" : host } or None
+                   "blynk"    : { "secrets" : "cred/.secrets", "server" : "192.168.0.10" },
+                   # See hardware.DEFAULT_SETTINGS
+                   "hardware" : {},
+                   # See governor.DEFAULT_RATES
+                   "frameRates" : {},
+                   # Seconds between render timing summaries, None for never
+                   "metricsInterval" : 300
+                   }
+
+def loadStations( filename ) :
+  # Returns the settings of every station in filename, complete with defaults
+  raw = json.load( open( filename ) )
+  stations = []
+  for idx, overrides in enumerate( raw[ "stations" ] ) :
+    settings = hardware.mergeSettings( DEFAULT_STATION, overrides )
+    if "name" not in overrides :
+      settings[ "name" ] = DEFAULT_STATION[ "name" ] + str( idx )
+    stations.append( settings )
+
+  names = [ settings[ "name" ] for settings in stations ]
+  if len( set( names ) ) != len( names ) :
+    raise ValueError( "Station names in " + filename + " are not unique" )
+  return stations
+
+class Capture:
+  def __init__(self):
+    self.captured = []
+  def __eq__(self, other):
+    self.captured.append(other)
+    return False
+
+def status( dataModel, stationRenderer ) :
+  # What a station reports with every heartbeat
+  currentConfig = dataModel.configs_[ dataModel.currentConfigIdx_ ] if 0 <= dataModel.currentConfigIdx_ < len( dataModel.configs_ ) else None
+  return {
+          "profile" : currentConfig.name_ if currentConfig is not None else None,
+          "running" : stationRenderer.runningTimer_,
+          "time"    : dataModel.currentTime_,
+          "frames"  : stationRenderer.frameStats(),
+          "render"  : stationRenderer.metrics_.summary()
+          }
+
+def runStation( settings, heartbeats=None, heartbeatInterval=1.0 ) :
+  # Bring up one complete station and run it until it quits. With a queue in
+  # heartbeats ( name, pid, monotonic time, status ) is put on it periodically
+  # so whoever started us knows we are alive
+  blynkint = None
+  if settings[ "blynk" ] is not None :
+    import blynkinterface
+    blynkint = blynkinterface.BlynkInterface( open( settings[ "blynk" ][ "secrets" ] ).read(), settings[ "blynk" ][ "server" ] )
+    blynkint.run()
+
+  hwctrl   = hardware.HardwareController( settings[ "hardware" ] )
+  print( "HW Controller Set Up" )
+
+  dataModel = model.DataModel( )
+  dataModel.loadFolder( settings[ "config" ] )
+  print( "Data Model Set Up" )
+
+  stationRenderer = renderer.Renderer( hwctrl, dataModel, settings[ "history" ], settings[ "frameRates" ] )
+  print( "Renderer Set Up" )
+
+  # Disable luma's stupid fucking cleanup since we can't configure it, it is
+  # not the only exit handler in a station process so pick it out by name
+  c = Capture()
+  atexit.unregister(c)
+  for hook in c.captured :
+    if getattr( hook, "__qualname__", "" ).endswith( "shutdown_hook" ) :
+      atexit.unregister( hook )
+
+  # Link the two
+  if blynkint is not None :
+    blynkint.renderer_ = stationRenderer
+
+  stationRenderer.requestRender()
+  nextSummary = None
+  if settings[ "metricsInterval" ] is not None :
+    nextSummary = time.monotonic() + settings[ "metricsInterval" ]
+  while not stationRenderer.quit() :
+    if not stationRenderer.renderThread_.is_alive() :
+      # Let whoever started us bring up a fresh station
+      raise RuntimeError( "Render thread died" )
+    if heartbeats is not None :
+      heartbeats.put( ( settings[ "name" ], os.getpid(), time.monotonic(), status( dataModel, stationRenderer ) ) )
+    if nextSummary is not None and time.monotonic() >= nextSummary :
+      print( "Render timings for " + settings[ "name" ] + " :" )
+      for line in stationRenderer.metrics_.report( stationRenderer.frameStats() ) :
+        print( "  " + line )
+      nextSummary += settings[ "metricsInterval" ]
+    time.sleep( heartbeatInterval )
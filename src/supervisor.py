@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+import multiprocessing
+import queue
+import sys
+import time
+
+import station
+
+class StationProcess( object ) :
+  """One station and the process currently running it"""
+  def __init__( self, settings ) :
+    self.settings_ = settings
+    self.name_     = settings[ "name" ]
+    self.process_  = None
+    self.startedAt_     = None
+    self.lastHeartbeat_ = None
+    self.status_        = {}
+    self.restarts_      = 0
+    # Crashes in a row without running long enough to count as stable
+    self.failures_      = 0
+    self.restartAt_     = None
+    self.exitcode_      = None
+
+  def alive( self ) :
+    return self.process_ is not None and self.process_.is_alive()
+
+
+class Supervisor( object ) :
+  """Runs every station in its own process, restarting any that crash or hang"""
+  def __init__( self, stations, heartbeatTimeout=10.0, startupTimeout=60.0, restartDelay=2.0, maxRestartDelay=60.0, stableTime=60.0, reportInterval=30.0 ) :
+    # Spawned, not forked, so no station inherits another's GPIO or SPI state
+    self.context_    = multiprocessing.get_context( "spawn" )
+    self.heartbeats_ = self.context_.Queue()
+    self.stations_   = [ StationProcess( settings ) for settings in stations ]
+
+    self.heartbeatTimeout_ = heartbeatTimeout
+    self.startupTimeout_   = startupTimeout
+    self.restartDelay_     = restartDelay
+    self.maxRestartDelay_  = maxRestartDelay
+    self.stableTime_       = stableTime
+    self.reportInterval_   = reportInterval
+    self.quit_ = False
+
+  def start( self, proc ) :
+    proc.process_ = self.context_.Process(
+                                          target=station.runStation,
+                                          args=( proc.settings_, self.heartbeats_ ),
+                                          name=proc.name_,
+                                          daemon=True
+                                          )
+    proc.process_.start()
+    proc.startedAt_     = time.monotonic()
+    proc.lastHeartbeat_ = None
+    proc.restartAt_     = None
+    proc.exitcode_      = None
+    print( "Started " + proc.name_ + " [ pid " + str( proc.process_.pid ) + " ]" )
+
+  def receive( self, timeout ) :
+    # Drain every heartbeat waiting, blocking up to timeout for the first
+    byName = {}
+    for proc in self.stations_ :
+      byName[ proc.name_ ] = proc
+
+    try :
+      beat = self.heartbeats_.get( timeout=timeout )
+      while True :
+        name, pid, sent, status = beat
+        proc = byName.get( name )
+        # Anything from a process we already replaced is stale
+        if proc is not None and proc.process_ is not None and proc.process_.pid == pid :
+          proc.lastHeartbeat_ = time.monotonic()
+          proc.status_        = status
+        beat = self.heartbeats_.get_nowait()
+    except queue.Empty :
+      pass
+
+  def check( self ) :
+    now = time.monotonic()
+    for proc in self.stations_ :
+      if proc.restartAt_ is not None :
+        if now >= proc.restartAt_ :
+          proc.restarts_ += 1
+          self.start( proc )
+        continue
+
+      if not proc.alive() :
+        proc.exitcode_ = proc.process_.exitcode
+        print( "ERROR: " + proc.name_ + " exited [ code " + str( proc.exitcode_ ) + " ]" )
+        self.scheduleRestart( proc, now )
+      elif self.hung( proc, now ) :
+        print( "ERROR: " + proc.name_ + " stopped sending heartbeats, terminating" )
+        proc.process_.terminate()
+        proc.process_.join( 5 )
+        if proc.process_.is_alive() :
+          proc.process_.kill()
+          proc.process_.join()
+        proc.exitcode_ = proc.process_.exitcode
+        self.scheduleRestart( proc, now )
+
+  def hung( self, proc, now ) :
+    if proc.lastHeartbeat_ is None :
+      # Still bringing up hardware and loading profiles
+      return now - proc.startedAt_ > self.startupTimeout_
+    return now - proc.lastHeartbeat_ > self.heartbeatTimeout_
+
+  def scheduleRestart( self, proc, now ) :
+    # Back off while a station keeps crashing straight away
+    if now - proc.startedAt_ >= self.stableTime_ :
+      proc.failures_ = 0
+    delay = min( self.restartDelay_ * 2 ** proc.failures_, self.maxRestartDelay_ )
+    proc.failures_ += 1
+    proc.restartAt_ = now + delay
+    proc.status_    = {}
+    print( "Restarting " + proc.name_ + " in " + str( delay ) + " sec" )
+
+  def health( self ) :
+    # { name : health } for every station
+    now = time.monotonic()
+    report = {}
+    for proc in self.stations_ :
+      if proc.restartAt_ is not None :
+        state = "RESTARTING"
+      elif not proc.alive() :
+        state = "DEAD"
+      elif proc.lastHeartbeat_ is None :
+        state = "STARTING"
+      else :
+        state = "OK"
+
+      report[ proc.name_ ] = {
+                              "state"         : state,
+                              "pid"           : proc.process_.pid if proc.alive() else None,
+                              "uptime"        : now - proc.startedAt_ if proc.alive() else 0.0,
+                              "lastHeartbeat" : now - proc.lastHeartbeat_ if proc.lastHeartbeat_ is not None else None,
+                              "restarts"      : proc.restarts_,
+                              "exitcode"      : proc.exitcode_,
+                              "status"        : dict( proc.status_ )
+                              }
+    return report
+
+  def report( self ) :
+    for name, health in self.health().items() :
+      line = "{0: <12} {1: <10} pid {2} restarts {3}".format( name, health[ "state" ], health[ "pid" ], health[ "restarts" ] )
+      status = health[ "status" ]
+      if status.get( "profile" ) is not None :
+        line += ", " + ( "running " if status[ "running" ] else "idle on " ) + status[ "profile" ]
+        if status[ "running" ] :
+          line += " at {0:.1f} sec".format( status[ "time" ] )
+      if "frames" in status :
+        line += ", frames sent {0} skipped {1}".format( status[ "frames" ][ "sent" ], status[ "frames" ][ "skipped" ] )
+      if "render" in status :
+        line += ", frame p50 {0:.1f} p99 {1:.1f} ms".format( status[ "render" ][ "frame" ][ "p50" ], status[ "render" ][ "frame" ][ "p99" ] )
+      print( line )
+
+  def run( self ) :
+    for proc in self.stations_ :
+      self.start( proc )
+
+    nextReport = time.monotonic() + self.reportInterval_
+    try :
+      while not self.quit_ :
+        self.receive( 1.0 )
+        self.check()
+        if time.monotonic() >= nextReport :
+          self.report()
+          nextReport += self.reportInterval_
+    finally :
+      self.stop()
+
+  def stop( self ) :
+    self.quit_ = True
+    for proc in self.stations_ :
+      proc.restartAt_ = None
+      if proc.alive() :
+        proc.process_.terminate()
+    for proc in self.stations_ :
+      if proc.process_ is not None :
+        proc.process_.join( 5 )
+
+
+if __name__ == '__main__':
+  # One process per station in the stations file, each with its own profiles,
+  # pins and display
+  stations = station.loadStations( sys.argv[1] if len( sys.argv ) > 1 else "stations.json" )
+  print( "Supervising " + str( len( stations ) ) + " stations" )
+  try :
+    Supervisor( stations ).run()
+  except KeyboardInterrupt :
+    pass
@@ -1,5 +1,88 @@
 import numpy as np
 from inspect import signature
+from PIL import Image, ImageDraw
+
+def unionBoxes( boxes ) :
+  # Smallest ( left, top, right, bottom ) box covering all of boxes, or None
+  if len( boxes ) == 0 : return None
+  return ( min( [ box[0] for box in boxes ] ), min( [ box[1] for box in boxes ] ),
+           max( [ box[2] for box in boxes ] ), max( [ box[3] for box in boxes ] ) )
+
+def mergeBoxes( boxes ) :
+  # Merge overlapping or touching boxes until none are left, so no pixel is
+  # sent twice and each window costs its setup only once
+  merged = list( boxes )
+  done   = False
+  while not done :
+    done = True
+    for i in range( len( merged ) ) :
+      for j in range( i + 1, len( merged ) ) :
+        a = merged[ i ]
+        b = merged[ j ]
+        if a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3] :
+          merged[ i ] = unionBoxes( [ a, b ] )
+          merged.pop( j )
+          done = False
+          break
+      if not done : break
+  return merged
+
+class GlyphAtlas( object ) :
+  """Glyph masks for one font, rasterized once and drawn in any colour"""
+  def __init__( self, font ) :
+    self.font_   = font
+    # { ( char, subpixel shift ) : ( coverage, ( left, top ) ) }, coverage
+    # None for blank glyphs
+    self.glyphs_ = {}
+    self.lineHeight_ = font.getbbox( "A" )[3]
+
+  def glyph( self, char, shift=0.0 ) :
+    key = ( char, shift )
+    if key not in self.glyphs_ :
+      box = self.font_.getbbox( char )
+      if box[2] <= box[0] or box[3] <= box[1] :
+        self.glyphs_[ key ] = ( None, ( 0, 0 ) )
+      else :
+        # Centred lines can start mid pixel, which changes the antialiasing
+        mask = Image.new( "L", ( box[2] - box[0] + ( 1 if shift else 0 ), box[3] - box[1] ) )
+        ImageDraw.Draw( mask ).text( ( shift - box[0], -box[1] ), char, font=self.font_, fill=255 )
+        self.glyphs_[ key ] = ( np.asarray( mask, dtype=np.int32 ), ( box[0], box[1] ) )
+    return self.glyphs_[ key ]
+
+  def mask( self, text, align="left", spacing=4 ) :
+    # ( mask, ( left, top ) ) of text laid out like ImageDraw.text() would,
+    # mask None if nothing would be drawn
+    lines  = text.split( "\n" )
+    widths = [ self.font_.getlength( line ) for line in lines ]
+    placed = []
+    for row, line in enumerate( lines ) :
+      x = 0.0
+      if align == "center" :
+        x = ( max( widths ) - widths[ row ] ) / 2.0
+      elif align == "right" :
+        x = max( widths ) - widths[ row ]
+      y = row * ( self.lineHeight_ + spacing )
+      for idx, char in enumerate( line ) :
+        glyph, offset = self.glyph( char, x % 1 )
+        if glyph is not None :
+          placed.append( ( glyph, int( x ) + int( self.font_.getlength( line[:idx] ) ) + offset[0], y + offset[1] ) )
+
+    if len( placed ) == 0 : return None, ( 0, 0 )
+    box      = unionBoxes( [ ( gx, gy, gx + glyph.shape[1], gy + glyph.shape[0] ) for glyph, gx, gy in placed ] )
+    coverage = np.zeros( ( box[3] - box[1], box[2] - box[0] ), dtype=np.int32 )
+    for glyph, gx, gy in placed :
+      # Coverage of glyphs that touch adds up, rounded the way Pillow does
+      area = coverage[ gy - box[1] : gy - box[1] + glyph.shape[0], gx - box[0] : gx - box[0] + glyph.shape[1] ]
+      area += glyph - ( area * glyph + 127 ) // 255
+    return Image.fromarray( coverage.astype( np.uint8 ), "L" ), box[:2]
+
+# One atlas per loaded font, shared by every widget using it
+atlases = {}
+
+def glyphAtlas( font ) :
+  if font not in atlases :
+    atlases[ font ] = GlyphAtlas( font )
+  return atlases[ font ]
 
 class Widget( object ) :
   def __init__( self, x=0, y=0, width=1, height=1 ):
@@ -38,6 +121,10 @@ class Widget( object ) :
     self.hidden_   = False
     self.name_     = "Widget"
 
+    # What was on screen as of the last damaged() call
+    self.drawnState_  = None
+    self.drawnBounds_ = None
+
   def setX( self, x ) :
     self.x_ = x
     self.calcCentroid()
@@ -161,6 +248,29 @@ class Widget( object ) :
   def render( self ) :
     pass
 
+  def bounds( self ) :
+    # Pixels drawing may touch as a ( left, top, right, bottom ) box
+    return ( self.x_, self.y_, self.x_ + self.width_ + 1, self.y_ + self.height_ + 1 )
+
+  def appearance( self ) :
+    # Everything that changes what render() draws, while hidden nothing else matters
+    if self.hidden_ : return ( True, )
+    return ( False, self.x_, self.y_, self.width_, self.height_, self.currentFg_, self.currentBg_, self.selected_, self.hasFocus_ )
+
+  def state( self ) :
+    # Everything that changes how we look on screen, including what others draw on us
+    return self.appearance()
+
+  def damaged( self ) :
+    # Box to send to the display if we look different since the last call
+    state = self.state()
+    if state == self.drawnState_ : return None
+
+    old = self.drawnBounds_
+    self.drawnState_  = state
+    self.drawnBounds_ = None if self.hidden_ else self.bounds()
+    return unionBoxes( [ box for box in ( old, self.drawnBounds_ ) if box is not None ] )
+
 
 class TextBox( Widget ):
   """A Scolling graph"""
@@ -174,10 +284,44 @@ class TextBox( Widget ):
     self.textPosY_  = textPosY
     self.align_     = aligned
     self.spacing_   = spacing
+    # Mask of text_ as last laid out, reused until the text or layout changes
+    self.textKey_   = None
+    self.textMask_  = None
+    self.textPos_   = ( 0, 0 )
+
+  def textMask( self ) :
+    key = ( self.text_, self.font_, self.align_, self.spacing_ )
+    if key != self.textKey_ :
+      self.textMask_, self.textPos_ = glyphAtlas( self.font_ ).mask( self.text_, self.align_, self.spacing_ )
+      self.textKey_ = key
+    return self.textMask_, self.textPos_
 
   def render( self ) :
     self.canvas_.rectangle( [ self.x_, self.y_, self.x_ + self.width_, self.y_ + self.height_ ], fill=self.currentBg_, outline=self.currentFg_, width=self.borderpx_  )
-    self.canvas_.text( [ self.textPosX_ + self.x_, self.textPosY_ + self.y_ ], self.text_, font=self.font_, fill=self.textColor_, align=self.align_, spacing=self.spacing_ )
+    if self.font_ is None :
+      # Pillow's default font, not worth caching
+      self.canvas_.text( [ self.textPosX_ + self.x_, self.textPosY_ + self.y_ ], self.text_, fill=self.textColor_, align=self.align_, spacing=self.spacing_ )
+      return
+    mask, pos = self.textMask()
+    if mask is not None :
+      self.canvas_.bitmap( ( self.textPosX_ + self.x_ + pos[0], self.textPosY_ + self.y_ + pos[1] ), mask, fill=self.textColor_ )
+
+  def bounds( self ) :
+    box = super(TextBox, self).bounds()
+    if self.canvas_ is None or self.text_ == "" : return box
+    # Text is not clipped to the box
+    if self.font_ is None :
+      text = self.canvas_.multiline_textbbox( ( self.textPosX_ + self.x_, self.textPosY_ + self.y_ ), self.text_, align=self.align_, spacing=self.spacing_ )
+      return unionBoxes( [ box, ( text[0], text[1], text[2] + 1, text[3] + 1 ) ] )
+    mask, pos = self.textMask()
+    if mask is None : return box
+    x = self.textPosX_ + self.x_ + pos[0]
+    y = self.textPosY_ + self.y_ + pos[1]
+    return unionBoxes( [ box, ( x, y, x + mask.size[0], y + mask.size[1] ) ] )
+
+  def appearance( self ) :
+    if self.hidden_ : return ( True, )
+    return super(TextBox, self).appearance() + ( self.text_, self.textColor_, self.font_, self.textPosX_, self.textPosY_, self.align_, self.spacing_, self.borderpx_ )
 
 class Graph(Widget):
   """A Scolling graph"""
@@ -198,6 +342,18 @@ class Graph(Widget):
     self.dataMin_     = 0
     self.dataMax_     = 0
 
+    # Set by whoever draws data on us to anything that identifies what was drawn
+    self.content_     = None
+    # Data is not clipped, rows it reached this frame as ( top, bottom )
+    self.dataExtentY_ = None
+
+    # Traces rendered for a span of columns around the view, scrolling crops
+    # it and only draws columns that come into the span
+    self.strip_       = None
+    self.stripKey_    = None
+    self.stripStart_  = 0
+    self.stripMargin_ = 64
+
   def moveLeft( self ) :
     self.drawPosX_ -= 1
 
@@ -210,6 +366,24 @@ class Graph(Widget):
   def moveDown( self ) :
     self.drawPosY_ += 1 
 
+  def bounds( self ) :
+    box = super(Graph, self).bounds()
+    if self.dataExtentY_ is None : return box
+    return unionBoxes( [ box, ( box[0], int( np.floor( self.dataExtentY_[0] ) ), box[2], int( np.ceil( self.dataExtentY_[1] ) ) + 1 ) ] )
+
+  def appearance( self ) :
+    # The grid does not scroll, only the data drawn on it does
+    if self.hidden_ : return ( True, )
+    return super(Graph, self).appearance() + ( self.gridPxIncx_, self.gridPxIncy_, self.gridcolor_, self.borderpx_ )
+
+  def state( self ) :
+    if self.hidden_ : return ( True, )
+    return self.appearance() + ( self.drawPosX_, self.drawPosY_, self.content_ )
+
+  def beginData( self ) :
+    # Call once a frame before drawTraces()
+    self.dataExtentY_ = None
+
   def render( self ) :
     self.canvas_.rectangle( [ self.x_, self.y_, self.x_ + self.width_, self.y_ + self.height_ ], fill=self.currentBg_, outline=self.currentFg_, width=self.borderpx_  )
 
@@ -313,6 +487,97 @@ class Graph(Widget):
     self.canvas_.line( pts, fill=color, width=1 )
     self.canvas_.point( pts, fill=ptColor )
 
+  def drawTraces( self, image, traces, key ) :
+    # Draw [ ( data, incx, incy, color, ptColor, marks ) ] straight onto
+    # image, marks are the points to mark when they are not the vertices.
+    # key identifies the data, the strip is kept until it changes
+    if self.hidden_ : return
+
+    view = self.width_ - 2 * self.borderpx_ + 1
+    key  = ( key, tuple( [ trace[1:5] for trace in traces ] ), self.drawPosY_, self.x_, self.y_, self.width_, self.height_, self.borderpx_, self.gridPxIncx_, image.mode, image.size )
+    first = self.drawPosX_
+    if key != self.stripKey_ :
+      self.stripKey_   = key
+      self.stripStart_ = first - self.stripMargin_
+      self.strip_      = self.traceColumns( image, traces, self.stripStart_, self.stripStart_ + view + 2 * self.stripMargin_ )
+    elif first < self.stripStart_ or first + view > self.stripStart_ + self.strip_.size[0] :
+      # Scrolled out of the strip, move it and draw only what is new
+      start  = first - self.stripMargin_
+      end    = start + self.strip_.size[0]
+      strip  = Image.new( "RGBA", self.strip_.size )
+      strip.paste( self.strip_, ( self.stripStart_ - start, 0 ) )
+      oldEnd = self.stripStart_ + self.strip_.size[0]
+      if start >= oldEnd or end <= self.stripStart_ :
+        strip = self.traceColumns( image, traces, start, end )
+      elif start > self.stripStart_ :
+        strip.paste( self.traceColumns( image, traces, oldEnd, end ), ( oldEnd - start, 0 ) )
+      else :
+        strip.paste( self.traceColumns( image, traces, start, self.stripStart_ ), ( 0, 0 ) )
+      self.strip_      = strip
+      self.stripStart_ = start
+
+    visible = self.strip_.crop( ( first - self.stripStart_, 0, first - self.stripStart_ + view, self.strip_.size[1] ) )
+    image.paste( visible, ( self.x_ + self.borderpx_, 0 ), mask=visible )
+
+    rows = visible.getchannel( "A" ).getbbox()
+    if rows is not None :
+      if self.dataExtentY_ is not None :
+        rows = unionBoxes( [ rows, ( 0, self.dataExtentY_[0], 0, self.dataExtentY_[1] + 1 ) ] )
+      self.dataExtentY_ = ( rows[1], rows[3] - 1 )
+
+  def traceColumns( self, image, traces, start, end ) :
+    # Traces between data columns start and end, as full height RGBA
+    strip  = Image.new( "RGBA", ( end - start, image.size[1] ) )
+    canvas = ImageDraw.Draw( strip )
+    for data, incx, incy, color, ptColor, marks in traces :
+      dataPerPixX = incx / self.gridPxIncx_
+      dataPerPixY = incy / self.gridPxIncx_
+      self.dataMin_ = self.drawPosY_ * dataPerPixY
+      self.dataMax_ = dataPerPixY * ( self.height_ - 2 * self.borderpx_ ) + self.dataMin_
+
+      # Whole pixels in profile columns, so every span agrees where a line goes
+      columns = data[0] / dataPerPixX
+      first   = max( int( np.searchsorted( columns, start, side="left" ) ) - 1, 0 )
+      last    = int( np.searchsorted( columns, end, side="right" ) ) + 1
+      if last - first < 1 : continue
+      x  = np.floor( columns[ first : last ] ) - start
+      y  = np.floor( self.getYDataPx( data[1][ first : last ] ) )
+      pts = list( zip( x, y ) )
+      if len( pts ) > 1 :
+        canvas.line( pts, fill=color, width=1 )
+
+      if marks is not None :
+        columns = marks[0] / dataPerPixX
+        inside  = ( columns >= start - 1 ) & ( columns < end + 1 )
+        pts = list( zip( np.floor( columns[ inside ] ) - start, np.floor( self.getYDataPx( marks[1][ inside ] ) ) ) )
+      canvas.point( pts, fill=ptColor )
+    return strip
+
+class Layer( object ) :
+  """Widgets rasterized together into a cached image, only redrawn when one of them looks different"""
+  def __init__( self, managers ) :
+    self.managers_ = managers
+    self.image_    = None
+    self.key_      = None
+    self.rebuilds_ = 0
+
+  def key( self ) :
+    return tuple( [ widget.appearance() for manager in self.managers_ for name, widget in manager.widgets_.items() ] )
+
+  def image( self, mode, size ) :
+    # The cached image, do not draw on it
+    key = ( mode, size, self.key() )
+    if key != self.key_ :
+      self.image_ = Image.new( mode, size )
+      canvas = ImageDraw.Draw( self.image_ )
+      for manager in self.managers_ :
+        for name, widget in manager.widgets_.items() :
+          widget.draw( canvas )
+      self.key_ = key
+      self.rebuilds_ += 1
+    return self.image_
+
+
 class WidgetManager( Widget ) :
   def __init__( self ) :
     super(WidgetManager, self).__init__( )
@@ -322,6 +587,8 @@ class WidgetManager( Widget ) :
     self.currentWidget_ = None
     self.defaultWidget_ = None
     self.adjustCentroid_ = True
+    # Where removed widgets were last drawn
+    self.removed_ = []
 
   def onInput( self, direction ) :
     # print( "Inside of manager : " + self.name_ )
@@ -383,6 +650,41 @@ class WidgetManager( Widget ) :
       self.centerX_ = np.sum( x ) / len( x )
       self.centerY_ = np.sum( y ) / len( y )
   
+  def removeWidget( self, name ) :
+    widget = self.widgets_.pop( name )
+    idx    = self.widgetsList_.index( widget )
+    self.widgetsList_.pop( idx )
+    if widget.drawnBounds_ is not None :
+      self.removed_.append( widget.drawnBounds_ )
+
+    if self.defaultWidget_ is widget :
+      self.defaultWidget_ = self.widgetsList_[0] if len( self.widgetsList_ ) > 0 else None
+
+    if self.currentWidget_ is widget :
+      # Move selection to the neighbour that took its place
+      self.currentWidget_ = None
+      if len( self.widgetsList_ ) > 0 :
+        self.currentWidget_ = self.widgetsList_[ min( idx, len( self.widgetsList_ ) - 1 ) ]
+        self.currentWidget_.select()
+
+    if self.adjustCentroid_ and len( self.widgets_ ) > 0 :
+      x = [ v.centerX_ for k, v in self.widgets_.items() ]
+      y = [ v.centerY_ for k, v in self.widgets_.items() ]
+
+      self.centerX_ = np.sum( x ) / len( x )
+      self.centerY_ = np.sum( y ) / len( y )
+    return widget
+
+  def collectDamage( self ) :
+    # Boxes of every widget that changed since the last call
+    boxes = self.removed_
+    self.removed_ = []
+    for widget in self.widgetsList_ :
+      box = widget.damaged()
+      if box is not None :
+        boxes.append( box )
+    return boxes
+
   def getCurrentWidgetIndex( self ) :
     if self.currentWidget_ is not None :
       return self.widgetsList_.index( self.currentWidget_ )